@@ -0,0 +1,238 @@
+"""Benchmarks for the fatigue detection pipeline
+
+Usage:
+    $ python benchmark.py detect-scale --source cabin.mp4 --scales 1 0.75 0.5 0.25
+    $ python benchmark.py metrics --n 10000
+    $ python benchmark.py render --source cabin.mp4 --display-width 480
+    $ python benchmark.py prep --source cabin.mp4
+    $ python benchmark.py backends --source cabin.mp4 --backends pytorch torchscript onnx --device cpu
+"""
+
+import argparse
+import time
+from itertools import islice
+
+import cv2
+import numpy as np
+
+from utils.datasets import iter_frames
+
+
+# 读取视频文件或图片目录中的帧, 最多 limit 帧
+def load_frames(source, limit=300):
+    frames = [img for _, _, img in islice(iter_frames(source), limit)]
+    assert frames, f'No frames found in {source}'
+    return frames
+
+
+# 不同检测缩放比例下的人脸检测耗时, 以及EAR/MAR相对全分辨率检测的误差
+def bench_detect_scale(frames, scales):
+    import myfatigue
+
+    myfatigue.load()
+    grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+
+    def measure(scale):
+        tracker = myfatigue.FaceTracker(enabled=False, detect_scale=scale)
+        ratios, dt = [], 0.0
+        for gray in grays:
+            t = time.time()
+            rects = tracker.detect(gray)
+            dt += time.time() - t
+            if not rects:
+                ratios.append(None)
+                continue
+            rect = max(rects, key=lambda r: r.area())
+            shape = myfatigue.face_utils.shape_to_np(myfatigue.engine.predictor(gray, rect))
+            ratios.append(myfatigue.calculate_ratios(shape))
+        return ratios, dt / len(grays) * 1000
+
+    base, _ = measure(1.0)
+    print('%8s%12s%10s%12s%12s' % ('scale', 'detect ms', 'found', 'EAR err', 'MAR err'))
+    for s in scales:
+        ratios, ms = measure(s)
+        both = [(r, b) for r, b in zip(ratios, base) if r is not None and b is not None]
+        ear_err = np.mean([abs(r[0] - b[0]) for r, b in both]) if both else float('nan')
+        mar_err = np.mean([abs(r[1] - b[1]) for r, b in both]) if both else float('nan')
+        found = sum(r is not None for r in ratios) / len(ratios)
+        print('%8.2f%12.2f%10.2f%12.4f%12.4f' % (s, ms, found, ear_err, mar_err))
+
+
+# EAR/MAR计算: 原来的逐点距离函数 vs 向量化的 landmark_metrics
+def bench_metrics(n):
+    import myfatigue
+
+    rng = np.random.default_rng(0)
+    shapes = (rng.random((n, 68, 2)) * 200 + 100).astype(np.int64)  # 随机特征点, 只用于计时
+
+    t = time.time()
+    for shape in shapes:
+        ear = (myfatigue.calculate_eye_aspect_ratio(shape[myfatigue.lStart:myfatigue.lEnd]) +
+               myfatigue.calculate_eye_aspect_ratio(shape[myfatigue.rStart:myfatigue.rEnd])) / 2.0
+        mar = myfatigue.calculate_mouth_aspect_ratio(shape[myfatigue.mStart:myfatigue.mEnd])
+    t_old = time.time() - t
+
+    t = time.time()
+    for shape in shapes:
+        m = myfatigue.landmark_metrics(shape)
+    t_new = time.time() - t
+
+    t = time.time()
+    m = myfatigue.landmark_metrics(shapes)
+    t_stack = time.time() - t
+
+    # 检查两种实现的结果一致
+    ref = np.array([myfatigue.calculate_mouth_aspect_ratio(s[myfatigue.mStart:myfatigue.mEnd]) for s in shapes[:100]])
+    assert np.allclose(ref, m['mar'][:100], rtol=1e-4), 'landmark_metrics MAR mismatch'
+
+    print('%-28s%12s' % ('method', 'us/face'))
+    print('%-28s%12.2f' % ('euclidean/norm per pair', t_old / n * 1E6))
+    print('%-28s%12.2f' % ('landmark_metrics (68,2)', t_new / n * 1E6))
+    print('%-28s%12.2f' % ('landmark_metrics (T,68,2)', t_stack / n * 1E6))
+
+
+# 每帧绘制的开销: 只分析 vs 原尺寸绘制 vs 缩小后的显示副本上绘制
+def bench_render(frames, display_width):
+    import myfarame
+
+    myfarame.mydetect.load()
+    myfarame.myfatigue.load()
+    results = []
+    t = time.time()
+    for f in frames:
+        results.append(myfarame.analyze(f))
+    t_analyze = time.time() - t
+
+    t = time.time()
+    for f, r in zip(frames, results):
+        myfarame.render(f.copy(), r)
+    t_full = time.time() - t
+
+    t = time.time()
+    for f, r in zip(frames, results):
+        myfarame.render(f, r, min(1.0, display_width / f.shape[1]))
+    t_small = time.time() - t
+
+    n = len(frames)
+    print('%-28s%12s' % ('stage', 'ms/frame'))
+    print('%-28s%12.2f' % ('analyze only', t_analyze / n * 1000))
+    print('%-28s%12.2f' % ('render full (with copy)', t_full / n * 1000))
+    print('%-28s%12.2f' % (f'render {display_width}px copy', t_small / n * 1000))
+
+
+# 检测输入预处理: 原来每帧新分配的 letterbox/transpose/归一化 vs 预分配缓冲区的 DetectorEngine.prepare
+def bench_prep(frames):
+    import torch
+    import mydetect
+    from utils.letterbox import letterbox
+
+    engine = mydetect.engine.load()
+
+    def old(im0):
+        img = letterbox(im0, new_shape=engine.imgsz, stride=engine.stride)[0]
+        img = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1))
+        img = torch.from_numpy(img).to(engine.device)
+        img = img.half() if engine.half else img.float()
+        return img / 255.0
+
+    # 两种实现的结果一致(resize 的结果相同, 只有半精度舍入的差别)
+    assert torch.allclose(old(frames[0]).float(), engine.prepare(frames[0]).float(), atol=1e-3), 'prepare mismatch'
+
+    print('%-28s%12s' % ('method', 'ms/frame'))
+    for name, fn in (('letterbox + copies', old), ('prepare (preallocated)', engine.prepare)):
+        fn(frames[0])
+        t = time.time()
+        for f in frames:
+            fn(f)
+        if engine.device.type != 'cpu':
+            torch.cuda.synchronize()
+        print('%-28s%12.3f' % (name, (time.time() - t) / len(frames) * 1000))
+
+
+# 检测后端: 以第一个后端的结果为基准检查一致性(同类别且 IoU 达到阈值算匹配, 置信度差), 并比较每帧耗时
+def bench_backends(frames, backends, device, iou_thres, min_match, optimize=None):
+    import torch
+    import mydetect
+    from utils.general import box_iou
+
+    results, times = {}, {}
+    for name in backends:
+        engine = mydetect.DetectorEngine(device=device, backend=name, warmup_shapes=[frames[0].shape[:2]],
+                                         optimize=optimize if name == 'pytorch' else None).load()
+        for f in frames[:5]:
+            engine.predict(f)
+        dets, t = [], time.time()
+        for f in frames:
+            dets.append(engine.predict(f))
+        times[name] = (time.time() - t) / len(frames) * 1000
+        results[name] = dets
+
+    ref = results[backends[0]]
+    ok = True
+    print('%-14s%12s%10s%10s%14s%8s' % ('backend', 'ms/frame', 'speedup', 'match', 'max conf err', 'parity'))
+    for name in backends:
+        matched = total = 0
+        conf_err = 0.0
+        for a, b in zip(ref, results[name]):
+            total += len(a)
+            if not len(a) or not len(b):
+                continue
+            iou = box_iou(torch.from_numpy(a['xyxy']), torch.from_numpy(b['xyxy'])).numpy()
+            iou[a['cls'][:, None] != b['cls'][None, :]] = 0  # 类别不同不算匹配
+            j = iou.argmax(1)
+            hit = iou[np.arange(len(a)), j] >= iou_thres
+            matched += hit.sum()
+            if hit.any():
+                conf_err = max(conf_err, float(np.abs(a['conf'][hit] - b['conf'][j[hit]]).max()))
+        match = matched / total if total else 1.0
+        passed = match >= min_match
+        ok &= passed
+        print('%-14s%12.2f%10.2f%10.3f%14.4f%8s' % (name, times[name], times[backends[0]] / times[name], match,
+                                                   conf_err, 'PASS' if passed else 'FAIL'))
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('detect-scale', help='face detection scale vs EAR/MAR error')
+    p.add_argument('--source', type=str, required=True, help='video file or image directory')
+    p.add_argument('--limit', type=int, default=300, help='maximum number of frames')
+    p.add_argument('--scales', nargs='+', type=float, default=[1.0, 0.75, 0.5, 0.25], help='detection scales')
+
+    p = sub.add_parser('metrics', help='EAR/MAR computation micro-benchmark')
+    p.add_argument('--n', type=int, default=10000, help='number of landmark sets')
+
+    p = sub.add_parser('render', help='per-frame cost of drawing the annotations')
+    p.add_argument('--source', type=str, required=True, help='video file or image directory')
+    p.add_argument('--limit', type=int, default=300, help='maximum number of frames')
+    p.add_argument('--display-width', type=int, default=480, help='width of the downscaled display copy')
+
+    p = sub.add_parser('prep', help='detector input preprocessing cost')
+    p.add_argument('--source', type=str, required=True, help='video file or image directory')
+    p.add_argument('--limit', type=int, default=300, help='maximum number of frames')
+
+    p = sub.add_parser('backends', help='detector backend parity and latency')
+    p.add_argument('--source', type=str, required=True, help='video file or image directory (recorded frames)')
+    p.add_argument('--limit', type=int, default=300, help='maximum number of frames')
+    p.add_argument('--backends', nargs='+', default=['pytorch', 'torchscript', 'onnx'],
+                   help='backends to compare, the first one is the reference')
+    p.add_argument('--device', type=str, default='cpu', help='cuda device, i.e. 0 or cpu')
+    p.add_argument('--iou-thres', type=float, default=0.9, help='IoU for a detection to match the reference')
+    p.add_argument('--min-match', type=float, default=0.98, help='fraction of reference detections that must match')
+    p.add_argument('--optimize', type=str, default=None, help='pytorch backend optimize mode: jit or compile')
+
+    opt = parser.parse_args()
+    if opt.command == 'detect-scale':
+        bench_detect_scale(load_frames(opt.source, opt.limit), opt.scales)
+    elif opt.command == 'metrics':
+        bench_metrics(opt.n)
+    elif opt.command == 'render':
+        bench_render(load_frames(opt.source, opt.limit), opt.display_width)
+    elif opt.command == 'prep':
+        bench_prep(load_frames(opt.source, opt.limit))
+    elif opt.command == 'backends':
+        if not bench_backends(load_frames(opt.source, opt.limit), opt.backends, opt.device, opt.iou_thres,
+                              opt.min_match, opt.optimize):
+            raise SystemExit(1)
@@ -1,18 +1,25 @@
 
+import json
+import os
+import time
+
 
 class Config:
     def __init__(self):
+        # 驾驶员标定, 不随统计数据重置
+        self.DRIVER_ID = 'default'  # 当前驾驶员, 用于查找已保存的标定结果
+        self.PROFILE_PATH = 'profiles/driver_profiles.json'  # 标定结果保存位置
+        self.CALIBRATION_SECONDS = 30.0  # 标定阶段采集的时长(秒)
         self.reset()
 
+    # 眼睛和嘴巴的阈值由 FatiguDetector 管理(初始值、自适应调整和驾驶员标定), 这里只保存计数
     def reset(self):
         # 眨眼相关
-        self.EYE_AR_THRESH = 0.2
         self.EYE_AR_CONSEC_FRAMES = 3
         self.COUNTER = 0  # 眨眼帧计数器
         self.TOTAL = 0  # 眨眼总数
 
         # 哈欠相关
-        self.MAR_THRESH = 0.5
         self.MOUTH_AR_CONSEC_FRAMES = 5
         self.mCOUNTER = 0  # 打哈欠帧计数器
         self.mTOTAL = 0  # 打哈欠总数
@@ -40,3 +47,34 @@ class Config:
 
 config = Config()
 
+
+# 驾驶员标定结果的本地存储, 以 JSON 保存 {驾驶员: {阈值和基线}}; path 为 None 时只保存在内存中
+class DriverProfileStore:
+    def __init__(self, path):
+        self.path = path
+        self.profiles = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f'读取标定文件失败: {e}')
+
+    def get(self, driver_id):
+        return self.profiles.get(driver_id)
+
+    def put(self, driver_id, profile):
+        self.profiles[driver_id] = dict(profile, updated=time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.save()
+
+    # 先写临时文件再替换, 避免写到一半时损坏已有的标定结果
+    def save(self):
+        if not self.path:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.profiles, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
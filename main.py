@@ -1,3 +1,4 @@
+import argparse
 import atexit
 import sys
 import time
@@ -5,161 +6,198 @@ import time
 import cv2
 import numpy as np
 from Window import Ui_Form
-from PyQt5.QtCore import QTimer
 from PyQt5 import QtWidgets, QtCore
 from PyQt5.QtGui import QImage, QPixmap
 from config import config
 import myfarame
+import mydetect
+from myscore import FatiguDetector
+from mypipeline import LatestFrameGrabber, AdaptiveRateController
 from playsound import playsound
-from threading import Thread
+from threading import Thread, Lock
 
-# 自适应阈值计算器
-class AdaptiveThresholdCalculator:
-    def __init__(self, init_eye_thresh=0.26):
-        self.eye_thresh = init_eye_thresh
-        self.eye_buffer = []
-        self.buff_size = 30
+# 等比例缩放到显示区域 (宽, 高) 之内的尺寸; 对结果再算一次得到同一尺寸,
+# 推理线程按它绘制后, UI线程不用再缩放
+def fit_size(w, h, box_w, box_h, upscale=True):
+    scale = min(box_w / w, box_h / h)
+    if not upscale:
+        scale = min(1.0, scale)
+    return round(w * scale), round(h * scale)
 
-        self.eye_adjust_factor = 0.05
-        self.min_eye_thresh = 0.15
-        self.max_eye_thresh = 0.35
 
-    def update_thresholds(self, eye_ar):
-        # 记录眼睛纵横比数据
-        self.eye_buffer.append(eye_ar)
-        # 维护缓冲区大小, 让其保持在 30 帧
-        if len(self.eye_buffer) > self.buff_size:
-            self.eye_buffer.pop(0)
-        if len(self.eye_buffer) == self.buff_size:
-            eye_mean = np.mean(self.eye_buffer)
-
-            if eye_mean < self.eye_thresh - 0.1:
-                self.eye_thresh = max(self.min_eye_thresh, self.eye_thresh-self.eye_adjust_factor)
-
-            elif eye_mean > self.eye_thresh + 0.1:
-                self.eye_thresh = min(self.max_eye_thresh, self.eye_thresh + self.eye_adjust_factor)
-
-
-        return self.eye_thresh
-
-
-# 疲劳检测类
-class FatiguDetector:
+# 显示路径: 缩放和颜色转换都写入预分配的缓冲区, 先缩放再转换颜色,
+# 支持 QImage.Format_BGR888 (Qt 5.14+) 时直接显示BGR数据, 跳过颜色转换
+class FrameDisplay:
     def __init__(self):
-        self.thresholds_cal = AdaptiveThresholdCalculator()
-        # 眼睛参数
-        self.EYE_AR_FRAMES = 2
-
-        # 嘴巴参数
-        self.MAR_THRESH = 0.65
-        self.MOUTH_AR_FRAME = 3
-
-        # 疲劳参数
-        self.FATIGUE_THRESHOLD = 0.30
-        self.WARNING_THRESHOLD = 0.15
-
-        # 上次评估时间
-        self.last_check_time = time.time()
-        # 上次的疲劳时间
-        self.last_fatigue_time = 0
-        # 上次的警告时间
-        self.last_warning_time = 0
-
-        # 初始化计数器
-        self.reset_count()
-
-        # 每隔2秒评估一次疲劳状态
-        self.FATIGUE_CHECK_INTERVAL = 2.0
-        # 状态维持 30 秒
-        self.STATUS_MAINTAIN_DURATION = 30.0
-
-
-    # 重置计数器
-    def reset_count(self):
-        self.eye_count = 0
-        self.total_eye_closed = 0
-        self.eye_cycle_count = 0
-        self.thirty_sec_eye = 0  # 新增
-
-        self.mouth_counter = 0
-        self.total_mouth_open = 0
-        self.mouth_cycle_count = 0
-        self.thirty_sec_mouth = 0  # 新增
-
-
-    # 检测疲劳状态, 'normal'、'warning'、“fatigue”
-    def detec_fatigue(self, eyear, mouthar):
-        # 获取自适应阈值
-        self.EYE_AR_THRESH = self.thresholds_cal.update_thresholds(eyear)
-
-        # print(f"EYE_AR{self.EYE_AR_THRESH}, eyear: {eyear}")
-
-        if eyear < self.EYE_AR_THRESH:
-            self.eye_count += 1
-            self.eye_cycle_count +=1
-        else:
-            if self.eye_count>=self.EYE_AR_FRAMES:
-                self.total_eye_closed += 1
-                self.thirty_sec_eye += 1
-            self.eye_count = 0
-
-        if mouthar > self.MAR_THRESH:
-            self.mouth_counter += 1
-            self.mouth_cycle_count += 1
+        self.resized = None
+        self.rgb = None
+        self.allocations = 0  # 缓冲区分配次数, 显示尺寸不变时不再增加
+        self.use_bgr888 = hasattr(QImage, 'Format_BGR888')
+
+    def _buffer(self, buf, shape):
+        if buf is None or buf.shape != shape:
+            self.allocations += 1
+            buf = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    # 返回引用缓冲区内存的 QImage, 需要在下一帧之前转换成 QPixmap
+    def to_qimage(self, frame, target_w, target_h):
+        if frame.shape[:2] == (target_h, target_w) and frame.flags.c_contiguous:
+            img = frame  # 推理线程已经按显示尺寸绘制, 不用再缩放
         else:
-            if self.mouth_counter >= self.MOUTH_AR_FRAME:
-                self.total_mouth_open += 1
-                self.thirty_sec_mouth += 1
-            self.mouth_counter = 0
-        current_time = time.time()
-        current_status = 'normal'
-
-        if current_time - self.last_check_time >= self.FATIGUE_CHECK_INTERVAL:
-            # 疲劳分数计算
-            time_interval = max(0.1, current_time - self.last_check_time)
-            fatigue_score = self.cal_fatigue_score(time_interval)
-            print(f'疲劳分数: {fatigue_score}')
-
-            # 复位
-            self._reset_cycle_count()
-            self.last_check_time = current_time
-
-            # 根据疲劳状态，提醒
-            if fatigue_score > self.FATIGUE_THRESHOLD:
-                self.last_fatigue_time = current_time
-                print("检测到疲劳状态")
-            elif fatigue_score > self.WARNING_THRESHOLD:
-                print("检测到警告状态")
-
-        if current_time - self.last_fatigue_time < self.STATUS_MAINTAIN_DURATION:
-            return 'fatigue'
-        elif current_time - self.last_warning_time < self.STATUS_MAINTAIN_DURATION:
-            return 'warning'
+            self.resized = self._buffer(self.resized, (target_h, target_w, 3))
+            img = cv2.resize(frame, (target_w, target_h), dst=self.resized, interpolation=cv2.INTER_AREA)
+        if self.use_bgr888:
+            fmt = QImage.Format_BGR888
         else:
-            return current_status
+            self.rgb = self._buffer(self.rgb, img.shape)
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=self.rgb)
+            fmt = QImage.Format_RGB888
+        return QImage(img.data, target_w, target_h, img.strides[0], fmt)
 
 
-    # 计算疲劳分数
-    def cal_fatigue_score(self, time_interval):
-        est_frames = max(1, time_interval*30)
-        eye_ratio = min(1, self.eye_cycle_count / est_frames)
-        mouth_ratio = min(1, self.mouth_counter / est_frames)
+# 推理线程: 从采集线程取最新帧, 完成检测和疲劳评估后通过信号交给UI线程
+class InferenceWorker(QtCore.QThread):
+    # (处理后的帧, 检测结果, 疲劳状态, 采集时间戳)
+    frame_ready = QtCore.pyqtSignal(object, object, str, float)
 
-        print(f'闭眼帧数{self.eye_cycle_count}, 张嘴帧数: {self.mouth_cycle_count}, 估计帧数: {est_frames}')
-        print(f'闭眼比例: {eye_ratio}, 张嘴比例: {mouth_ratio}')
+    def __init__(self, grabber, fatigue_detector, rate_controller=None, parent=None):
+        super().__init__(parent)
+        self.grabber = grabber
+        self.fatigue_detector = fatigue_detector
+        self.rate_controller = rate_controller  # 记录各阶段耗时, 用于自适应帧率
+        self.processed = 0  # 完成推理的帧数
+        self.dropped = 0  # UI还没画完上一帧, 没有送去显示的帧数
+        self.display_size = None  # 显示区域 (宽, 高), 只在缩小后的显示副本上绘制, None 表示按原尺寸绘制
+        # 镜像翻转和缩小后的显示副本各使用两块缓冲区轮流写入, 避免覆盖UI线程还在显示的那一块
+        self._flip_bufs = [None, None]
+        self._render_bufs = [None, None]
+        self._emitted = 0  # 最近一次送去显示的缓冲区
+        self._writing = 1  # 当前写入的缓冲区
+        self.allocations = 0  # 翻转和显示缓冲区的分配次数
+        self._running = True
+        self._ui_busy = False
+        self._pending_op = None  # UI线程切换的工作点, 在两帧之间由推理线程应用
+        self._pending_driver = None  # UI线程切换的驾驶员 (驾驶员, 是否重新标定), 同样在两帧之间应用
+        self._lock = Lock()
+
+    def run(self):
+        while self._running:
+            self._apply_pending()
+            frame, stamp = self.grabber.read(timeout=0.5)
+            if frame is None:
+                continue
+            t0 = time.time()
+            try:
+                frame = self._flip(frame)
+                result = myfarame.analyze(frame)
+                ret = myfarame.result_to_ret(result)
+                if ret:
+                    lab, eyear, mouthar = ret
+                    status = self.fatigue_detector.detec_fatigue(eyear, mouthar, stamp)
+                else:
+                    status = 'normal'
+                    self.fatigue_detector.reset_window()
+                    print('未检测到人脸，重置状态')
+            except Exception as e:
+                print(e)
+                continue
+            self.processed += 1
+            if self.rate_controller is not None:
+                self.rate_controller.record_stage('queue', t0 - stamp)
+                self.rate_controller.record_stage('inference', time.time() - t0)
+
+            # 疲劳评估每帧都做, 显示只保留最新结果, UI积压时直接丢弃
+            with self._lock:
+                if self._ui_busy:
+                    self.dropped += 1
+                    continue
+                self._ui_busy = True
+            # 只绘制要显示的帧
+            try:
+                frame = self._render(frame, result)
+            except Exception as e:
+                print(e)
+            self._emitted = self._writing
+            self.frame_ready.emit(frame, ret, status, stamp)
+
+    # 当前写入的那一块缓冲区, 尺寸变化时重新分配
+    def _buffer(self, bufs, shape):
+        buf = bufs[self._writing]
+        if buf is None or buf.shape != shape:
+            self.allocations += 1
+            buf = bufs[self._writing] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    # 镜像翻转到预分配的缓冲区, 写入不在显示中的那一块
+    def _flip(self, frame):
+        self._writing = 1 - self._emitted
+        return cv2.flip(frame, 1, dst=self._buffer(self._flip_bufs, frame.shape))
+
+    # 显示区域比帧小时缩小到预分配的显示缓冲区再绘制, 否则直接在翻转缓冲区上绘制
+    def _render(self, frame, result):
+        dst = None
+        if self.display_size:
+            h, w = frame.shape[:2]
+            size = fit_size(w, h, *self.display_size, upscale=False)
+            if size != (w, h):
+                dst = self._buffer(self._render_bufs, (size[1], size[0]) + frame.shape[2:])
+        return myfarame.render(frame, result, dst=dst)
+
+    # UI线程调用, 只记录最新的工作点; 检测输入尺寸不能在 predict() 中途修改
+    def set_operating_point(self, op):
+        with self._lock:
+            self._pending_op = op
+
+    # UI线程调用, 疲劳评估的状态只在推理线程中修改
+    def set_driver(self, driver_id, recalibrate=False):
+        with self._lock:
+            self._pending_driver = (driver_id, recalibrate)
+
+    def _apply_pending(self):
+        with self._lock:
+            op, self._pending_op = self._pending_op, None
+            driver, self._pending_driver = self._pending_driver, None
+        if op is not None:
+            apply_operating_point(self.grabber, op)
+        if driver is not None:
+            self.fatigue_detector.select_driver(*driver)
+
+    # UI线程画完一帧后调用
+    def frame_consumed(self):
+        with self._lock:
+            self._ui_busy = False
+
+    def stop(self):
+        self._running = False
+        self.wait(2000)
+
+
+# 把工作点应用到采集线程、YOLO调度器和检测输入尺寸
+def apply_operating_point(grabber, op):
+    grabber.interval = 1.0 / op['capture_fps']
+    myfarame.scheduler.stride = op['detector_stride']
+    mydetect.engine.imgsz = op['imgsz']
 
-        return 0.8*eye_ratio + 0.2*mouth_ratio
-    # 重置计数
-    def _reset_cycle_count(self):
-        self.eye_cycle_count = 0
-        self.mouth_cycle_count = 0
 
 # 摄像头控制器
 class CameraController:
     def __init__(self, parent_window):
         self.parent_window = parent_window
-        self.timer = QTimer()
         self.cleaned = False
+        self.grabber = None
+        self.worker = None
+
+        # 流水线统计
+        self.displayed = 0
+        self.display_latency = 0.0
+        self.last_stats_time = time.time()
+        self.STATS_INTERVAL = 5.0
+
+        self.display = FrameDisplay()
+
+        # 自适应帧率: 按端到端延迟调整采集帧率、YOLO检测间隔和输入尺寸
+        self.rate_controller = AdaptiveRateController(target_latency=0.15)
 
         # 记录疲劳的状态
         self.last_status = 'normal'
@@ -176,8 +214,14 @@ class CameraController:
             self.cap = cv2.VideoCapture(0)
             if not self.cap.isOpened():
                 raise RuntimeError("摄像头未准备就绪")
-            self.timer.timeout.connect(self.update_frame)
-            self.timer.start(20)
+            self.grabber = LatestFrameGrabber(self.cap)
+            self._apply_operating_point(self.rate_controller.operating_point())
+            self.grabber.start()
+            self.worker = InferenceWorker(self.grabber, self.fatigue_detector, self.rate_controller)
+            label_size = self.parent_window.label_20.size()
+            self.worker.display_size = (label_size.width(), label_size.height())
+            self.worker.frame_ready.connect(self.update_frame)
+            self.worker.start()
         except Exception as e:
             self.cleanup()
             raise
@@ -230,8 +274,8 @@ class CameraController:
             finally:
                 self.warning_playing = False
 
-    def update_action_labels(self, action_label):
-        """根据检测到的行为更新对应的UI标签"""
+    def update_action_labels(self, labels):
+        """根据检测到的行为更新对应的UI标签, labels 为这一帧检测到的全部类别(按置信度从高到低)"""
         # 行为检测计数器管理
         self.action_counter = getattr(self, 'action_counter', 0)
 
@@ -239,7 +283,7 @@ class CameraController:
         self.action_counter = max(0, self.action_counter - 1)
 
         # 更新检测到的行为标签
-        if action_label == "phone":
+        if "phone" in labels:
             self.parent_window.label_16.setText(
                 "<html><head/><body><p align='center'>"
                 "<span style='font-size:10pt;font-weight:600;'>是</span></p ></body></html>")
@@ -248,7 +292,7 @@ class CameraController:
                 "background-color:rgb(255, 0, 0)\n")
             self.action_counter = 5  # 重置计数器
 
-        elif action_label == "drink":
+        if "drink" in labels:
             self.parent_window.label_17.setText(
                 "<html><head/><body><p align='center'>"
                 "<span style='font-size:10pt;font-weight:600;'>是</span></p ></body></html>")
@@ -257,7 +301,7 @@ class CameraController:
                 "background-color:rgb(255, 0, 0)\n")
             self.action_counter = 5  # 重置计数器
 
-        elif action_label == "smoke":
+        if "smoke" in labels:
             self.parent_window.label_19.setText(
                 "<html><head/><body><p align='center'>"
                 "<span style='font-size:10pt;font-weight;600;'>是</span></p ></body></html>")
@@ -293,28 +337,14 @@ class CameraController:
                 "background-color:rgb(85, 255, 127)\n")
 
 
-    # 更新视频
-    def update_frame(self):
+    # 更新视频, 在UI线程中由 InferenceWorker.frame_ready 信号触发
+    def update_frame(self, frame, ret, current_status, stamp):
         try:
-            ret, frame = self.cap.read()
-            if not ret:
-                return
-
-            frame = cv2.flip(frame, 1)
-            frame, ret = myfarame.frametest(frame)
             previous_status = self.last_status  # 使用上一次的状态作为默认值
             if ret:
-                lab,eyear, mouthar = ret
-                print("action"+lab[0])
-                self.update_action_labels(lab[0])
-
-                previous_status = self.last_status
-                current_status = self.fatigue_detector.detec_fatigue(eyear, mouthar)
-            else:
-                current_status = 'normal'
-                self.fatigue_detector.eye_cycle_count = 0
-                self.fatigue_detector.mouth_cycle_count = 0
-                print('未检测到人脸，重置状态')
+                lab = ret[0]
+                print("action"+','.join(lab))
+                self.update_action_labels(lab)
             self.last_status = current_status
 
             #### 状态更新
@@ -327,35 +357,82 @@ class CameraController:
                     self.warning_playing = False
 
 
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
             # 等比例缩放
             label_size = self.parent_window.label_20.size()
-            h, w = rgb_frame.shape[:2]
-
-            target_w = label_size.width()
-            target_h = int(h*(target_w/w))
-
-            if target_h > label_size.height():
-                target_h = label_size.height()
-                target_w = int(w * (target_h / h))
-
-            resized = cv2.resize(rgb_frame, (target_w, target_h), interpolation=cv2.INTER_AREA)
+            self.worker.display_size = (label_size.width(), label_size.height())
+            h, w = frame.shape[:2]
+            target_w, target_h = fit_size(w, h, label_size.width(), label_size.height())
 
             # 显示图像
-            q_img = QImage(
-                resized.data,
-                target_w,
-                target_h,
-                resized.strides[0],
-                QImage.Format_RGB888
-            )
-
+            q_img = self.display.to_qimage(frame, target_w, target_h)
             self.parent_window.label_20.setPixmap(QPixmap.fromImage(q_img))
             self._update_statistics()
+
+            self.displayed += 1
+            self.display_latency = time.time() - stamp
+            self.rate_controller.record_latency(self.display_latency)
+            op = self.rate_controller.update()
+            if op is not None:
+                self._apply_operating_point(op)
+            self._report_pipeline_stats()
         except Exception as e:
             print(e)
             self.cleanup()
+        finally:
+            if self.worker is not None:
+                self.worker.frame_consumed()
+
+    # 推理线程运行时交给它在两帧之间应用, 否则直接应用; 并显示在窗口标题和日志中
+    def _apply_operating_point(self, op):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.set_operating_point(op)
+        else:
+            apply_operating_point(self.grabber, op)
+        self._show_operating_point(op)
+        print(f"[INFO] 工作点切换: {op}")
+
+    # 切换驾驶员或重新标定当前驾驶员, 推理线程运行时交给它在两帧之间处理
+    def select_driver(self, driver_id, recalibrate=False):
+        driver_id = driver_id.strip() or config.DRIVER_ID
+        if driver_id == self.fatigue_detector.driver_id and not recalibrate:
+            return  # 输入框失去焦点但驾驶员没有变化
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.set_driver(driver_id, recalibrate)
+        else:
+            self.fatigue_detector.select_driver(driver_id, recalibrate)
+        print(f"[INFO] 驾驶员: {driver_id}{', 重新标定' if recalibrate else ''}")
+
+    def _show_operating_point(self, op):
+        self.parent_window.setWindowTitle(
+            f"疲劳检测 - 档位 {op['level']} | 采集 {op['capture_fps']}fps | "
+            f"检测间隔 {op['detector_stride']}帧 | 输入 {op['imgsz']} | 延迟 {op['latency_ms']}ms")
+
+    # 各级流水线的帧数和丢帧数
+    def pipeline_stats(self):
+        return {
+            'captured': self.grabber.captured if self.grabber else 0,
+            'capture_dropped': self.grabber.dropped if self.grabber else 0,
+            'capture_skipped': self.grabber.skipped if self.grabber else 0,
+            'processed': self.worker.processed if self.worker else 0,
+            'display_dropped': self.worker.dropped if self.worker else 0,
+            'displayed': self.displayed,
+            'display_allocations': self.display.allocations + (self.worker.allocations if self.worker else 0),
+            'latency_ms': round(self.display_latency * 1000, 1),
+            'operating_point': self.rate_controller.operating_point(),
+            'face_stages': myfarame.myfatigue.tracker.timing_stats(),
+        }
+
+    def _report_pipeline_stats(self):
+        current_time = time.time()
+        if current_time - self.last_stats_time < self.STATS_INTERVAL:
+            return
+        self.last_stats_time = current_time
+        stats = self.pipeline_stats()
+        print(f"采集 {stats['captured']} 帧(丢弃 {stats['capture_dropped']}), "
+              f"推理 {stats['processed']} 帧(未显示 {stats['display_dropped']}), "
+              f"显示 {stats['displayed']} 帧, 显示延迟 {stats['latency_ms']}ms, 工作点 {stats['operating_point']}")
+        print(myfarame.myfatigue.tracker.timing_summary())
+        self._show_operating_point(stats['operating_point'])
 
     def _update_statistics(self):
         detector = self.fatigue_detector
@@ -396,9 +473,11 @@ class CameraController:
         print("释放摄像头资源...")
 
         try:
-            if hasattr(self, 'timer'):
-                self.timer.timeout.disconnect()
-                self.timer.stop()
+            # 先停推理线程和采集线程, 再释放摄像头
+            if getattr(self, 'worker', None) is not None:
+                self.worker.stop()
+            if getattr(self, 'grabber', None) is not None:
+                self.grabber.stop()
 
             if hasattr(self, 'cap') and self.cap.isOpened():
                 self.cap.release()
@@ -411,14 +490,31 @@ class MainWindow(QtWidgets.QWidget, Ui_Form):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setupUi(self)
-        self.init_ui()
         self.camera = None
+        self.init_ui()
 
     # 初始化UI
     def init_ui(self):
         self.pushButton.clicked.connect(self.reset_counters)
+        self.init_driver_controls()
         self.init_camera()
 
+    # 驾驶员输入框和重新标定按钮, 放在复位按钮下面(Window.ui 生成的布局之外)
+    def init_driver_controls(self):
+        self.driverEdit = QtWidgets.QLineEdit(config.DRIVER_ID, self.widget)
+        self.driverEdit.setPlaceholderText("驾驶员")
+        self.driverEdit.setToolTip("输入驾驶员编号后回车, 加载该驾驶员的标定结果, 没有时开始标定")
+        self.driverEdit.editingFinished.connect(self.select_driver)
+        self.gridLayout.addWidget(self.driverEdit, 6, 0, 1, 2)
+        self.calibrateButton = QtWidgets.QPushButton("重新标定", self.widget)
+        self.calibrateButton.setStyleSheet("background-color:rgb(150, 150, 150)")
+        self.calibrateButton.clicked.connect(lambda: self.select_driver(recalibrate=True))
+        self.gridLayout.addWidget(self.calibrateButton, 6, 2, 1, 2)
+
+    def select_driver(self, recalibrate=False):
+        if self.camera is not None:
+            self.camera.select_driver(self.driverEdit.text(), recalibrate)
+
     def reset_counters(self):
         counters = [
             (self.label_10, 0),
@@ -476,8 +572,15 @@ class MainWindow(QtWidgets.QWidget, Ui_Form):
             print(f'计数器更新失败: {e}')
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--driver', type=str, default=config.DRIVER_ID, help='driver id used for calibration')
+    parser.add_argument('--profile-path', type=str, default=config.PROFILE_PATH, help='driver profile file')
+    opt, qt_args = parser.parse_known_args()  # 其余参数交给Qt
+    config.DRIVER_ID, config.PROFILE_PATH = opt.driver, opt.profile_path
     try:
-        app = QtWidgets.QApplication(sys.argv)
+        # 模型在后台加载, 不阻塞界面和摄像头的初始化
+        myfarame.preload()
+        app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
         main_window = MainWindow()
         main_window.show()
         return app.exec()
@@ -6,10 +6,11 @@ import numpy as np
 import requests
 import torch
 import torch.nn as nn
+import torchvision
 from PIL import Image, ImageDraw
 
-from utils.datasets import letterbox
-from utils.general import non_max_suppression, make_divisible, scale_coords, xyxy2xywh
+from utils.letterbox import letterbox
+from utils.general import non_max_suppression, make_divisible, scale_coords, xyxy2xywh, xywh2xyxy
 from utils.plots import color_list
 
 
@@ -164,6 +165,23 @@ class NMS(nn.Module):
         return non_max_suppression(x[0], conf_thres=self.conf, iou_thres=self.iou, classes=self.classes)
 
 
+class ExportNMS(NMS):
+    # Export-friendly NMS: fixed-size output (batch, max_det, 6) of [xyxy, conf, cls], zero-padded after the last box
+    max_det = 100  # maximum detections per image
+    max_wh = 4096  # (pixels) class offset so one nms() call suppresses per class
+
+    def forward(self, x):
+        out = []
+        for p in x[0]:  # per image, unrolled for the fixed export batch size
+            conf, j = (p[:, 5:] * p[:, 4:5]).max(1)  # conf = obj_conf * cls_conf, best class only
+            keep = conf > self.conf  # confidence filter
+            box, conf, j = xywh2xyxy(p[keep, :4]), conf[keep], j[keep].float()
+            i = torchvision.ops.nms(box + j[:, None] * self.max_wh, conf, self.iou)[:self.max_det]  # batched NMS
+            det = torch.cat((box[i], conf[i, None], j[i, None]), 1)
+            out.append(torch.cat((det, det.new_zeros(self.max_det, 6)), 0)[:self.max_det])  # pad to max_det
+        return torch.stack(out, 0)
+
+
 class autoShape(nn.Module):
     # input-robust model wrapper for passing cv2/np/PIL/torch inputs. Includes preprocessing, inference and NMS
     img_size = 640  # inference size (pixels)
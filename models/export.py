@@ -2,9 +2,11 @@
 
 Usage:
     $ export PYTHONPATH="$PWD" && python models/export.py --weights ./weights/yolov5s.pt --img 640 --batch 1
+    $ export PYTHONPATH="$PWD" && python models/export.py --weights ./weights/best.pt --img 480 640 --nms --max-det 100
 """
 
 import argparse
+import json
 import sys
 import time
 
@@ -23,6 +25,10 @@ if __name__ == '__main__':
     parser.add_argument('--weights', type=str, default='./yolov5s.pt', help='weights path')  # from yolov5/models/
     parser.add_argument('--img-size', nargs='+', type=int, default=[640, 640], help='image size')  # height, width
     parser.add_argument('--batch-size', type=int, default=1, help='batch size')
+    parser.add_argument('--nms', action='store_true', help='bake decode, confidence filter and NMS into the graph')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='--nms object confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='--nms IOU threshold')
+    parser.add_argument('--max-det', type=int, default=100, help='--nms fixed number of output boxes per image')
     opt = parser.parse_args()
     opt.img_size *= 2 if len(opt.img_size) == 1 else 1  # expand
     print(opt)
@@ -50,15 +56,28 @@ if __name__ == '__main__':
                 m.act = SiLU()
         # elif isinstance(m, models.yolo.Detect):
         #     m.forward = m.forward_export  # assign forward (optional)
-    model.model[-1].export = True  # set Detect() layer export=True
+    m = model.model[-1]  # Detect()
+    if opt.nms:  # decoded Detect() output into ExportNMS, graph outputs (batch, max_det, 6) [xyxy, conf, cls]
+        models.common.ExportNMS.conf = opt.conf_thres
+        models.common.ExportNMS.iou = opt.iou_thres
+        models.common.ExportNMS.max_det = opt.max_det
+        model.nms(module=models.common.ExportNMS)
+    else:
+        m.export = True  # set Detect() layer export=True
     y = model(img)  # dry run
 
+    # Metadata needed to decode the raw Detect() outputs at inference time (see mybackend.py)
+    meta = json.dumps({'names': list(labels), 'stride': m.stride.tolist(),
+                       'anchor_grid': m.anchor_grid.view(m.nl, -1, 2).tolist(),  # pixels, shape(nl,na,2)
+                       'img_size': opt.img_size, 'batch_size': opt.batch_size,
+                       'nms': opt.nms, 'max_det': opt.max_det})
+
     # TorchScript export
     try:
         print('\nStarting TorchScript export with torch %s...' % torch.__version__)
         f = opt.weights.replace('.pt', '.torchscript.pt')  # filename
         ts = torch.jit.trace(model, img)
-        ts.save(f)
+        ts.save(f, _extra_files={'config.txt': meta})
         print('TorchScript export success, saved as %s' % f)
     except Exception as e:
         print('TorchScript export failure: %s' % e)
@@ -70,11 +89,13 @@ if __name__ == '__main__':
         print('\nStarting ONNX export with onnx %s...' % onnx.__version__)
         f = opt.weights.replace('.pt', '.onnx')  # filename
         torch.onnx.export(model, img, f, verbose=False, opset_version=12, input_names=['images'],
-                          output_names=['classes', 'boxes'] if y is None else ['output'])
+                          output_names=['detections'] if opt.nms else ['classes', 'boxes'] if y is None else ['output'])
 
         # Checks
         onnx_model = onnx.load(f)  # load onnx model
         onnx.checker.check_model(onnx_model)  # check onnx model
+        onnx_model.metadata_props.add(key='config', value=meta)
+        onnx.save(onnx_model, f)
         # print(onnx.helper.printable_graph(onnx_model.graph))  # print a human readable model
         print('ONNX export success, saved as %s' % f)
     except Exception as e:
@@ -0,0 +1,172 @@
+"""Quantizes an exported YOLOv5 ONNX model to static INT8 (QDQ) with ONNX Runtime
+
+Calibrates on a folder of images, then compares the INT8 model against the FP32 model: mAP via ap_per_class (against
+YOLO-format labels when every image has one, otherwise against the FP32 detections) and CPU latency.
+The result is saved next to the weights as *.int8.onnx and can be loaded with mydetect.backend = 'onnx-int8'.
+
+Usage:
+    $ python models/export.py --weights ./weights/best.pt --img 480 640 --batch 1
+    $ export PYTHONPATH="$PWD" && python models/quantize.py --weights ./weights/best.pt --source ./cabin/images
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append('./')  # to run '$ python *.py' files in subdirectories
+
+import numpy as np
+import torch
+
+import mydetect
+from mybackend import backend_weights
+from utils.datasets import LoadImages, img2label_paths
+from utils.general import set_logging, box_iou, xywhn2xyxy
+from utils.letterbox import letterbox
+from utils.metrics import ap_per_class
+
+
+def onnx_config(f):
+    # Returns the metadata written by models/export.py
+    import onnx
+
+    meta = {p.key: p.value for p in onnx.load(f).metadata_props}
+    assert 'config' in meta, f'{f} has no export metadata, re-export it with models/export.py'
+    return json.loads(meta['config'])
+
+
+def calibration_images(source, img_size, limit):
+    # Yields (1,3,h,w) float32 inputs letterboxed to the fixed export shape, as mydetect prepares them
+    for i, (path, _, img0, _) in enumerate(LoadImages(source, img_size=max(img_size))):
+        if i >= limit:
+            break
+        img = letterbox(img0, img_size, auto=False)[0]
+        img = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1))  # BGR to RGB, to 3x416x416
+        yield img[None].astype(np.float32) / 255.0
+
+
+def quantize(f, f_int8, source, calib_images=200, per_channel=True):
+    from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, \
+        quantize_static
+    import onnx
+
+    meta = onnx_config(f)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.input_name = onnx.load(f).graph.input[0].name
+            self.images = calibration_images(source, meta['img_size'], calib_images)
+
+        def get_next(self):
+            img = next(self.images, None)
+            return None if img is None else {self.input_name: img}
+
+    quantize_static(f, f_int8, Reader(), quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=CalibrationMethod.MinMax)
+
+    # Carry the export metadata over so mybackend can decode the INT8 outputs
+    model = onnx.load(f_int8)
+    model.metadata_props.add(key='config', value=json.dumps(meta))
+    onnx.save(model, f_int8)
+
+
+def load_labels(files, shapes):
+    # Returns per-image [cls, x1, y1, x2, y2] pixel labels, or None if any image has no label file
+    labels = []
+    for f, (h, w) in zip(img2label_paths(files), shapes):
+        if not os.path.isfile(f):
+            return None
+        with open(f, 'r') as t:
+            x = np.array([l.split() for l in t.read().strip().splitlines()], dtype=np.float32).reshape(-1, 5)
+        x[:, 1:] = xywhn2xyxy(x[:, 1:], w, h, padw=0, padh=0)  # original images, no mosaic padding
+        labels.append(x)
+    return labels
+
+
+def match(det, labels, iouv):
+    # Returns a (n_det, n_iou) correct matrix, each label matched to at most one detection per IoU threshold
+    correct = np.zeros((len(det), len(iouv)), dtype=bool)
+    if not len(det) or not len(labels):
+        return correct
+    iou = box_iou(torch.from_numpy(labels[:, 1:]), torch.from_numpy(det['xyxy'])).numpy()  # (n_label, n_det)
+    iou[labels[:, :1] != det['cls'][None].astype(np.float32)] = 0  # classes must agree
+    for k, t in enumerate(iouv):
+        x = np.argwhere(iou >= t)  # [label, detection]
+        if len(x):
+            m = np.concatenate((x, iou[x[:, 0], x[:, 1]][:, None]), 1)
+            m = m[m[:, 2].argsort()[::-1]]
+            m = m[np.unique(m[:, 1], return_index=True)[1]]
+            m = m[np.unique(m[:, 0], return_index=True)[1]]
+            correct[m[:, 1].astype(int), k] = True
+    return correct
+
+
+def evaluate(engine, frames, labels):
+    # Returns mAP@0.5, mAP@0.5:0.95 and ms/frame of a mydetect.DetectorEngine on frames
+    iouv = np.linspace(0.5, 0.95, 10)
+    for f in frames[:3]:
+        engine.predict(f)  # warmup
+    stats, dets, t = [], [], time.time()
+    for f in frames:
+        dets.append(engine.predict(f))
+    ms = (time.time() - t) / len(frames) * 1000
+    for det, l in zip(dets, labels):
+        stats.append((match(det, l, iouv), det['conf'], det['cls'], l[:, 0]))
+    stats = [np.concatenate(x, 0) for x in zip(*stats)]
+    if not len(stats[3]):
+        return 0.0, 0.0, ms
+    ap = ap_per_class(*stats)[2]
+    return ap[:, 0].mean(), ap.mean(), ms
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='./weights/best.pt', help='*.pt or exported *.onnx path')
+    parser.add_argument('--source', type=str, required=True, help='calibration images (folder or glob)')
+    parser.add_argument('--val', type=str, default=None, help='evaluation images, default --source')
+    parser.add_argument('--calib-images', type=int, default=200, help='number of calibration images')
+    parser.add_argument('--val-images', type=int, default=500, help='number of evaluation images')
+    parser.add_argument('--per-tensor', action='store_true', help='per-tensor instead of per-channel weight scales')
+    parser.add_argument('--conf-thres', type=float, default=0.001, help='object confidence threshold for mAP')
+    parser.add_argument('--iou-thres', type=float, default=0.6, help='IOU threshold for NMS')
+    opt = parser.parse_args()
+    print(opt)
+    set_logging()
+    t = time.time()
+
+    f = backend_weights(opt.weights, 'onnx')
+    f_int8 = f[:-len('.onnx')] + '.int8.onnx'
+    assert os.path.isfile(f), f'{f} not found, export it first with models/export.py'
+
+    # Quantize
+    print(f'\nStarting static INT8 quantization of {f}...')
+    quantize(f, f_int8, opt.source, opt.calib_images, per_channel=not opt.per_tensor)
+    print(f'INT8 quantization success ({time.time() - t:.1f}s), saved as {f_int8}')
+
+    # Evaluate FP32 vs INT8
+    loader = LoadImages(opt.val or opt.source)
+    files, frames = [], []
+    for path, _, img0, _ in loader:
+        if len(frames) >= opt.val_images:
+            break
+        files.append(path)
+        frames.append(img0)
+    labels = load_labels(files, [x.shape[:2] for x in frames])
+    fp32, int8 = [mydetect.DetectorEngine(weights=w, device='cpu', backend=b, conf_thres=opt.conf_thres,
+                                          iou_thres=opt.iou_thres, warmup_shapes=[]).load()
+                  for w, b in ((f, 'onnx'), (f_int8, 'onnx-int8'))]
+    if labels is None:  # no ground truth, score both models against the FP32 detections
+        print('No labels found, using FP32 detections (conf > 0.25) as reference')
+        labels = [np.concatenate((d['cls'][:, None], d['xyxy']), 1)[d['conf'] > 0.25].astype(np.float32)
+                  for d in map(fp32.predict, frames)]
+
+    results = {name: evaluate(engine, frames, labels) for name, engine in (('FP32', fp32), ('INT8', int8))}
+    print('\n%-8s%12s%16s%12s' % ('model', 'mAP@.5', 'mAP@.5:.95', 'ms/frame'))
+    for name, (map50, map5095, ms) in results.items():
+        print('%-8s%12.4f%16.4f%12.2f' % (name, map50, map5095, ms))
+    (a50, a, a_ms), (b50, b, b_ms) = results['FP32'], results['INT8']
+    print(f'\nmAP@.5 delta {b50 - a50:+.4f}, mAP@.5:.95 delta {b - a:+.4f}, speedup {a_ms / b_ms:.2f}x')
+    print(f"Load it with mydetect.backend = 'onnx-int8' (weights {opt.weights})")
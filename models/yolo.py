@@ -23,6 +23,7 @@ except ImportError:
 class Detect(nn.Module):
     stride = None  # strides computed during build
     export = False  # onnx export
+    obj_thres = None  # (optional) only decode anchors with objectness above this, others are output as zeros
 
     def __init__(self, nc=80, anchors=(), ch=()):  # detection layer
         super(Detect, self).__init__()
@@ -46,16 +47,37 @@ class Detect(nn.Module):
             x[i] = x[i].view(bs, self.na, self.no, ny, nx).permute(0, 1, 3, 4, 2).contiguous()
 
             if not self.training:  # inference
-                if self.grid[i].shape[2:4] != x[i].shape[2:4]:
-                    self.grid[i] = self._make_grid(nx, ny).to(x[i].device)
-
-                y = x[i].sigmoid()
-                y[..., 0:2] = (y[..., 0:2] * 2. - 0.5 + self.grid[i].to(x[i].device)) * self.stride[i]  # xy
-                y[..., 2:4] = (y[..., 2:4] * 2) ** 2 * self.anchor_grid[i]  # wh
-                z.append(y.view(bs, -1, self.no))
+                z.append(self._decode(i, x[i]).view(bs, -1, self.no))
 
         return x if self.training else (torch.cat(z, 1), x)
 
+    def _decode_tensors(self, i, ny, nx, device, dtype):
+        # xy offset (grid - 0.5) * stride, xy gain 2 * stride and wh gain 4 * anchor for layer i,
+        # built once per input shape, device and dtype
+        cache = self.__dict__.setdefault('_decode_cache', {})  # not in __init__ so pickled models get it too
+        key = (i, ny, nx, device, dtype)
+        if key not in cache:
+            s = float(self.stride[i])
+            grid = self._make_grid(nx, ny).to(device)
+            cache[key] = ((grid - 0.5) * s).to(dtype), 2. * s, (self.anchor_grid[i] * 4).to(device, dtype)
+        return cache[key]
+
+    def _decode(self, i, x):
+        # x(bs,na,ny,nx,no) raw outputs to xywh (pixels), obj, cls
+        offset, gain, anchor = self._decode_tensors(i, x.shape[2], x.shape[3], x.device, x.dtype)
+        if self.obj_thres is None:
+            y = x.sigmoid()
+            return torch.cat((y[..., 0:2] * gain + offset, y[..., 2:4] ** 2 * anchor, y[..., 4:]), -1)
+
+        # Objectness is an upper bound on conf, so anchors below obj_thres can never pass a conf_thres >= obj_thres
+        keep = x[..., 4] > math.log(self.obj_thres / (1 - self.obj_thres))  # compare logits, no sigmoid needed
+        shape = x.shape[:4] + (2,)
+        r = x[keep].sigmoid()
+        y = torch.zeros_like(x)
+        y[keep] = torch.cat((r[:, 0:2] * gain + offset.expand(shape)[keep], r[:, 2:4] ** 2 * anchor.expand(shape)[keep],
+                             r[:, 4:]), -1)
+        return y
+
     @staticmethod
     def _make_grid(nx=20, ny=20):
         yv, xv = torch.meshgrid([torch.arange(ny), torch.arange(nx)])
@@ -170,11 +192,11 @@ class Model(nn.Module):
         self.info()
         return self
 
-    def nms(self, mode=True):  # add or remove NMS module
-        present = type(self.model[-1]) is NMS  # last layer is NMS
+    def nms(self, mode=True, module=NMS):  # add or remove NMS module, module=ExportNMS for fixed-size export output
+        present = isinstance(self.model[-1], NMS)  # last layer is NMS
         if mode and not present:
             print('Adding NMS... ')
-            m = NMS()  # module
+            m = module()  # module
             m.f = -1  # from
             m.i = self.model[-1].i + 1  # index
             self.model.add_module(name='%s' % m.i, module=m)  # add
@@ -0,0 +1,194 @@
+# 检测模型推理后端
+# 同一个调用约定: backend(img) 输入 (N,3,H,W) 归一化张量, 返回 NMS 之前的预测 (N, 锚框数, 5+类别数);
+# backend.detect(img, conf_thres, iou_thres) 返回每张图 NMS 之后的 (n,6) [xyxy, conf, cls]
+# pytorch: 直接加载 .pt; torchscript / onnx: 加载 models/export.py 导出的模型, 在这里完成解码
+# onnx-int8: 加载 models/quantize.py 量化后的模型
+import json
+
+import numpy as np
+import torch
+
+from models.experimental import attempt_load
+from utils.general import non_max_suppression
+from utils.torch_utils import file_hash, optimize_for_inference
+
+# 各后端默认的模型文件后缀, 和 models/export.py、models/quantize.py 的输出文件名一致
+suffixes = {'pytorch': '.pt', 'torchscript': '.torchscript.pt', 'onnx': '.onnx', 'onnx-int8': '.int8.onnx'}
+
+
+# 由 .pt 权重路径得到对应后端的模型文件路径
+def backend_weights(weights, name):
+    if name == 'pytorch' or weights.endswith(suffixes[name]):
+        return weights
+    return weights[:-len('.pt')] + suffixes[name] if weights.endswith('.pt') else weights + suffixes[name]
+
+
+class TorchBackend:
+    name = 'pytorch'
+
+    def __init__(self, weights, device, optimize=None, cache_dir=None, skip_low_obj=False):
+        self.weights = weights
+        self.device = device  # 输入张量所在的设备
+        self.half = device.type != 'cpu'  # 是否使用半精度(FP16) - GPU支持半精度
+        self.input_shape = None  # 固定的输入尺寸(高, 宽), None 表示任意32倍数的尺寸
+        self.batch_size = None  # 固定的批次大小, None 表示任意
+        self.model = None
+        self.names = []
+        self.stride = 32
+
+        # 优化推理: None 为原始的逐层执行, 'jit' 为冻结的TorchScript, 'compile' 为 torch.compile;
+        # 每种输入尺寸优化一次, 'jit' 的结果按权重哈希和输入尺寸缓存在 cache_dir
+        self.optimize = optimize
+        self.cache_dir = cache_dir
+        self.channels_last = optimize is not None  # 优化后的模型使用channels-last, 输入张量也按此格式分配
+        self._optimized = {}
+
+        # 跳过目标置信度低于 conf_thres 的锚框的解码(Detect.obj_thres), 不影响NMS的结果;
+        # 只在CPU上逐层执行时使用, 跟踪/编译的图和GPU上的布尔索引同步都不适合
+        self.skip_low_obj = skip_low_obj and optimize is None and device.type == 'cpu'
+
+    def load(self):
+        model = attempt_load(self.weights, map_location=self.device)  # 加载FP32模型
+        if self.half:
+            model.half()  # 转换为FP16半精度
+        self.names = model.module.names if hasattr(model, 'module') else model.names  # 获取类别名称
+        self.stride = int(model.stride.max())
+        self.model = model
+        if self.optimize:
+            self.key = f'{file_hash(self.weights)[:16]}_torch{torch.__version__}'
+        return self
+
+    def __call__(self, img):
+        if self.optimize is None:
+            return self.model(img)[0]
+        shape = (tuple(img.shape), img.dtype)
+        if shape not in self._optimized:
+            self._optimized[shape] = optimize_for_inference(self.model, img, self.optimize, self.cache_dir, self.key)
+        return self._optimized[shape](img.contiguous(memory_format=torch.channels_last))[0]
+
+    def detect(self, img, conf_thres, iou_thres):
+        if self.skip_low_obj and hasattr(self.model, 'model'):
+            self.model.model[-1].obj_thres = conf_thres if 0 < conf_thres < 1 else None  # Detect()
+        return non_max_suppression(self(img), conf_thres, iou_thres)
+
+
+# 导出模型的 Detect 层输出的是各层未解码的特征图 (N,na,ny,nx,no), 按 export.py 保存的锚框和步长解码
+class GridDecoder:
+    def __init__(self, stride, anchor_grid):
+        self.stride = stride  # 每层的步长
+        self.anchor_grid = torch.tensor(anchor_grid, dtype=torch.float32)  # (nl,na,2), 像素单位
+        self.grids = {}  # 按 (层, ny, nx, 设备) 缓存网格
+
+    def _grid(self, i, ny, nx, device):
+        key = (i, ny, nx, device)
+        if key not in self.grids:
+            yv, xv = torch.meshgrid([torch.arange(ny), torch.arange(nx)])
+            grid = torch.stack((xv, yv), 2).view(1, 1, ny, nx, 2).float()
+            self.grids[key] = grid.to(device), self.anchor_grid[i].view(1, -1, 1, 1, 2).to(device)
+        return self.grids[key]
+
+    def __call__(self, outputs):
+        z = []
+        for i, x in enumerate(outputs):
+            bs, na, ny, nx, no = x.shape
+            grid, anchor_grid = self._grid(i, ny, nx, x.device)
+            y = x.float().sigmoid()
+            xy = (y[..., 0:2] * 2. - 0.5 + grid) * self.stride[i]
+            wh = (y[..., 2:4] * 2) ** 2 * anchor_grid
+            z.append(torch.cat((xy, wh, y[..., 4:]), -1).view(bs, -1, no))
+        return torch.cat(z, 1)
+
+
+# 导出模型的公共部分: 读取 export.py 写入的元数据(类别名称、步长、锚框、输入尺寸)
+class ExportedBackend(TorchBackend):
+    def _configure(self, meta):
+        meta = json.loads(meta)
+        self.names = meta['names']
+        self.stride = int(max(meta['stride']))
+        self.input_shape = tuple(meta['img_size'])
+        self.batch_size = meta['batch_size']
+        self.nms = meta.get('nms', False)  # export.py --nms: 图中已完成解码和NMS, 输出 (N, max_det, 6), 不足的行补0
+        self.decode = GridDecoder(meta['stride'], meta['anchor_grid'])
+
+    # 固定批次的模型按批次大小分块推理, 不足一批的块补0到批次大小, 输出再截回实际的张数
+    def _run(self, img):
+        n = self.batch_size or len(img)
+        outputs = []
+        for i in range(0, len(img), n):
+            x = img[i:i + n]
+            if len(x) < n:
+                x = torch.cat((x, x.new_zeros((n - len(x),) + x.shape[1:])), 0)
+            outputs.append(self._output(self.forward(x))[:len(img) - i])
+        return torch.cat(outputs, 0)
+
+    def _output(self, y):
+        return y[0] if self.nms else self.decode(y)
+
+    def __call__(self, img):
+        assert not self.nms, f'{self.weights} was exported with --nms, use detect()'
+        return self._run(img)
+
+    def detect(self, img, conf_thres, iou_thres):
+        if not self.nms:
+            return super().detect(img, conf_thres, iou_thres)
+        # 图中的阈值在导出时已经确定, 这里只按更高的 conf_thres 去掉补齐的行和低置信度的框
+        return [d[d[:, 4] > conf_thres] for d in self._run(img).float()]
+
+
+class TorchScriptBackend(ExportedBackend):
+    name = 'torchscript'
+
+    def __init__(self, weights, device):
+        super().__init__(weights, device)
+        self.half = False  # 导出的是FP32模型
+
+    def load(self):
+        extra = {'config.txt': ''}
+        self.model = torch.jit.load(self.weights, map_location=self.device, _extra_files=extra)
+        self._configure(extra['config.txt'])
+        return self
+
+    def forward(self, img):
+        y = self.model(img)
+        return [y] if isinstance(y, torch.Tensor) else y
+
+
+class OnnxBackend(ExportedBackend):
+    name = 'onnx'
+
+    def __init__(self, weights, device):
+        super().__init__(weights, torch.device('cpu'))  # 输入以 numpy 交给 onnxruntime, 张量放在CPU上
+        self.half = False
+        self.providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if device.type != 'cpu' else \
+            ['CPUExecutionProvider']
+
+    def load(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = [p for p in self.providers if p in ort.get_available_providers()]
+        self.model = ort.InferenceSession(self.weights, options, providers=providers)
+        self.input_name = self.model.get_inputs()[0].name
+        self._configure(self.model.get_modelmeta().custom_metadata_map['config'])
+        return self
+
+    def forward(self, img):
+        outputs = self.model.run(None, {self.input_name: img.numpy().astype(np.float32, copy=False)})
+        return [torch.from_numpy(x) for x in outputs]
+
+
+# models/quantize.py 生成的静态INT8(QDQ)模型, 推理方式和FP32的ONNX模型相同
+class OnnxInt8Backend(OnnxBackend):
+    name = 'onnx-int8'
+
+
+backends = {b.name: b for b in (TorchBackend, TorchScriptBackend, OnnxBackend, OnnxInt8Backend)}
+
+
+# 按名称创建后端, weights 为 .pt 权重路径时自动换成该后端的模型文件; optimize 和 skip_low_obj 只用于 pytorch 后端
+def create_backend(name, weights, device, optimize=None, cache_dir=None, skip_low_obj=False):
+    assert name in backends, f'Unknown detector backend {name}, choose from {list(backends)}'
+    if name == 'pytorch':
+        return TorchBackend(weights, device, optimize, cache_dir, skip_low_obj)
+    return backends[name](backend_weights(weights, name), device)
@@ -1,113 +1,264 @@
 # 检测驾驶员是否分心，抽烟，睡觉
 
+import threading
+import time
+
 import numpy as np
 import cv2
 import torch
 from numpy import random
-from models.experimental import attempt_load
-from utils.general import check_img_size, non_max_suppression, scale_coords, set_logging
+from mybackend import create_backend
+from utils.general import check_img_size, scale_coords, set_logging
+from utils.letterbox import letterbox_plan
 from utils.torch_utils import select_device, time_synchronized
 
 
 # ====== 模型参数配置 ======
 weights = r'weights/best.pt'  # 模型权重文件路径
+backend = 'pytorch'  # 推理后端: 'pytorch', 'torchscript', 'onnx', 'onnx-int8'(见 mybackend.py)
+optimize = None  # pytorch 后端的优化推理: None, 'jit'(冻结的TorchScript, CPU推荐), 'compile'(torch.compile)
+optimize_cache = r'weights/.cache'  # 优化后模型的缓存目录, 按权重哈希和输入尺寸区分
+skip_low_obj = True  # pytorch 后端在CPU上跳过目标置信度低于阈值的锚框的解码
 opt_device = ''  # 设备选择: ''为自动选择, 'cpu'为CPU, '0'为第一个GPU
 imgsz = 640  # 输入图像尺寸
 opt_conf_thres = 0.6  # 置信度阈值(0-1之间)
 opt_iou_thres = 0.45  # IOU阈值(用于非极大值抑制)
+warmup_shapes = [(480, 640)]  # 加载时预热的原始帧尺寸(高, 宽), 默认摄像头为640x480
 
-# ====== 初始化设置 ======
-set_logging()  # 设置日志
-device = select_device(opt_device)  # 选择设备(CPU或GPU)
-half = device.type != 'cpu'  # 是否使用半精度(FP16) - GPU支持半精度
-
-# ====== 加载模型 ======
-model = attempt_load(weights, map_location=device)  # 加载FP32模型
-imgsz = check_img_size(imgsz, s=model.stride.max())  # 检查图像尺寸是否符合模型要求
-if half:
-    model.half()  # 转换为FP16半精度
-# ====== 获取类别名称和颜色 ======
-names = model.module.names if hasattr(model, 'module') else model.names  # 获取类别名称
-colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]  # 为每个类别生成随机颜色
-
-# 调用模型检测
-def predict(im0s):
-    # 对模型的预热
-    img = torch.zeros((1, 3, imgsz, imgsz), device=device)  # 初始化图像
-    _ = model(img.half() if half else img) if device.type != 'cpu' else None  # 运行一次推理
-    # ====== 图像预处理 ======
-    # 使用letterbox调整图像尺寸
-    img = letterbox(im0s, new_shape=imgsz)[0]
-    # 转换颜色通道和维度顺序: BGR->RGB, HWC->CHW
-    img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
-    img = np.ascontiguousarray(img)  # 确保内存连续
-
-    # ====== 转换为PyTorch张量 ======
-    img = torch.from_numpy(img).to(device)
-    img = img.half() if half else img.float()  # 转换为半精度或单精度
-    img /= 255.0  # 归一化到[0,1]范围
-    if img.ndimension() == 3:  # 如果是3维张量(没有批次维度)
-        img = img.unsqueeze(0)  # 添加批次维度1*3x416x416
-
-    # ====== 推理 ======
-    pred = model(img)[0]  # 模型推理
-
-    # ====== 非极大值抑制(NMS) ======
-    pred = non_max_suppression(pred, opt_conf_thres, opt_iou_thres)
-
-    # ====== 处理检测结果 ======
-    ret = []  # 存储最终结果
-    for i, det in enumerate(pred):  # 遍历每个检测结果(通常只有一个)
-        if len(det):  # 如果有检测到目标
-            # 将边界框坐标从缩放后的图像尺寸转换回原始图像尺寸
-            det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0s.shape).round()
-
-            # 遍历每个检测到的目标
-            for *xyxy, conf, cls in reversed(det):
-                label = f'{names[int(cls)]}'  # 获取类别标签
-                prob = round(float(conf) * 100, 2)  # 计算置信度百分比(保留2位小数)
-                ret_i = [label, prob, xyxy]  # 存储结果: [标签, 置信度, 边界框坐标]
-                ret.append(ret_i)
-        # 返回检测结果
-        # 每个结果包含:
-        #   label: 检测到的类别名称 ('face', 'smoke', 'drink', 'phone'等)
-        #   prob: 置信度百分比 (0-100)
+# 批量检测结果的结构化类型: 类别编号, 置信度(0-1), 边界框(左上x, 左上y, 右下x, 右下y);
+# 按C结构体对齐(每条24字节), 浮点字段的视图对齐, 可以直接交给 torch.from_numpy
+det_dtype = np.dtype([('cls', np.int16), ('conf', np.float32), ('xyxy', np.float32, (4,))], align=True)
+
+
+# 没有检测到目标时的空结果
+def empty_result():
+    return np.empty(0, dtype=det_dtype)
+
+
+# 检测模型引擎, 导入时不加载模型, 第一次使用或显式调用 load() 时才加载
+class DetectorEngine:
+    def __init__(self, weights=weights, device=opt_device, img_size=imgsz, conf_thres=opt_conf_thres,
+                 iou_thres=opt_iou_thres, warmup_shapes=warmup_shapes, backend=backend, optimize=optimize,
+                 optimize_cache=optimize_cache, skip_low_obj=skip_low_obj):
+        self.weights = weights
+        self.backend_name = backend
+        self.optimize = optimize
+        self.optimize_cache = optimize_cache
+        self.skip_low_obj = skip_low_obj
+        self.opt_device = device
+        self.imgsz = img_size
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.warmup_shapes = list(warmup_shapes)
+
+        self.device = None
+        self.half = False
+        self.stride = 32  # 模型最大下采样倍数, 加载后更新
+        self.backend = None
+        self.model = None
+        self.names = []
+        self.colors = []
+        self.stats = {}  # 启动耗时统计(秒)
+
+        self._warmed_shapes = set()  # 已经预热过的输入张量尺寸
+        self._inputs = {}  # 预分配的 (N,3,H,W) 输入张量, 按尺寸复用
+        self._plans = {}  # 每种原始帧尺寸的letterbox几何参数和缓冲区
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    # 加载模型, 重复调用直接返回; 后台预加载未完成时会等待其完成
+    def load(self):
+        if self.loaded:
+            return self
+        with self._lock:
+            if self.loaded:
+                return self
+            t0 = time.time()
+            set_logging()  # 设置日志
+            device = select_device(self.opt_device)  # 选择设备(CPU或GPU)
+            backend = create_backend(self.backend_name, self.weights, device, self.optimize,
+                                     self.optimize_cache, self.skip_low_obj).load()
+            self.stride = backend.stride
+            self.imgsz = check_img_size(self.imgsz, s=self.stride)  # 检查图像尺寸是否符合模型要求
+            self.names = backend.names  # 获取类别名称
+            self.colors = [[random.randint(0, 255) for _ in range(3)] for _ in self.names]  # 为每个类别生成随机颜色
+            self.device, self.half, self.backend = backend.device, backend.half, backend
+            self.model = backend.model
+            self.stats['load'] = time.time() - t0
+
+            t1 = time.time()
+            for shape in self.warmup_shapes:
+                self.warmup(shape)
+            self.stats['warmup'] = time.time() - t1
+            print(f"[INFO] {backend.name} detector loaded in {self.stats['load']:.2f}s, "
+                  f"warmup {self.stats['warmup']:.2f}s")
+        return self
+
+    # 在后台线程中加载模型, 和界面、摄像头的初始化并行
+    def preload(self):
+        if not self.loaded and self._thread is None:
+            self._thread = threading.Thread(target=self.load, daemon=True)
+            self._thread.start()
+        return self
+
+    # 导出的模型输入尺寸固定, 按该尺寸填充; 否则按 imgsz 缩放并填充到步长的倍数
+    def _letterbox_args(self, auto=True, imgsz=None):
+        fixed = self.backend.input_shape if self.backend is not None else None
+        return (fixed, False) if fixed else (imgsz or self.imgsz, auto)
+
+    def warmup(self, frame_shape):
+        # 按原始帧尺寸(高, 宽)预热一次, 同一个输入尺寸只预热一次, 只在GPU上或需要生成优化模型时进行
+        new_shape, auto = self._letterbox_args()
+        shape = (1, 3) + letterbox_plan(frame_shape, new_shape, auto=auto, stride=self.stride).shape
+        if (self.device.type == 'cpu' and self.backend.optimize is None) or shape in self._warmed_shapes:
+            return
+        t = time_synchronized()
+        img = torch.zeros(shape, device=self.device)
+        with torch.no_grad():
+            self.backend.detect(img.half() if self.half else img, self.conf_thres, self.iou_thres)
+        self._warmed_shapes.add(shape)
+        print(f'[INFO] warmup {shape} done ({(time_synchronized() - t) * 1000:.1f}ms)')
+
+    # 某种原始帧尺寸的letterbox几何参数(utils.letterbox 中缓存)和预分配的缓冲区, 同一尺寸只分配一次;
+    # imgsz 可能被其他线程修改(自适应帧率), 一帧或一批只取一次 plan, 预处理和坐标还原都使用它
+    def _plan(self, shape, auto=True, imgsz=None):
+        new_shape, auto = self._letterbox_args(auto, imgsz)
+        key = (shape[0], shape[1], new_shape, auto)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        geometry = letterbox_plan(shape, new_shape, auto=auto, stride=self.stride)
+        (nw, nh), (h, w) = geometry.new_unpad, geometry.shape
+
+        # 画布的边框只填充一次, 之后每帧只覆盖中间的图像区域; GPU上使用锁页内存加快拷贝
+        cuda = self.device.type != 'cpu'
+        canvas = torch.full((h, w, 3), 114, dtype=torch.uint8, pin_memory=cuda)
+        plan = {
+            'geometry': geometry,
+            'size': (nw, nh),
+            'offset': (geometry.top, geometry.left),
+            'shape': (h, w),
+            'canvas_t': canvas,
+            'canvas': canvas.numpy(),
+            'resized': np.empty((nh, nw, 3), dtype=np.uint8) if geometry.resize else None,
+            'canvas_dev': torch.empty((h, w, 3), dtype=torch.uint8, device=self.device) if cuda else None,
+        }
+        self._plans[key] = plan
+        return plan
+
+    def _get_input(self, shape):
+        if shape not in self._inputs:
+            memory_format = torch.channels_last if self.backend.channels_last else torch.contiguous_format
+            self._inputs[shape] = torch.empty(shape, device=self.device, memory_format=memory_format,
+                                              dtype=torch.float16 if self.half else torch.float32)
+        return self._inputs[shape]
+
+    # 预处理: 缩放到预分配的缓冲区, 写入画布时同时完成 BGR->RGB,
+    # 再一步完成 HWC->CHW、类型转换和归一化, 写入 out(3,H,W); out 为空时使用预分配的 (1,3,H,W) 张量
+    def prepare(self, im0, out=None, auto=True, plan=None):
+        plan = plan or self._plan(im0.shape, auto)
+        nw, nh = plan['size']
+        top, left = plan['offset']
+        img = im0
+        if plan['resized'] is not None:
+            img = cv2.resize(im0, (nw, nh), dst=plan['resized'], interpolation=cv2.INTER_LINEAR)
+        plan['canvas'][top:top + nh, left:left + nw] = img[:, :, ::-1]  # BGR to RGB
+
+        src = plan['canvas_t']
+        if plan['canvas_dev'] is not None:
+            src = plan['canvas_dev'].copy_(src)
+        if out is None:
+            out = self._get_input((1, 3) + plan['shape'])[0]
+        torch.mul(src.permute(2, 0, 1), 1 / 255.0, out=out)  # uint8 HWC -> 归一化的 CHW
+        return out
+
+    # 调用模型检测
+    def predict(self, im0s):
+        self.load()
+        # ====== 图像预处理 ======
+        # letterbox、BGR->RGB、HWC->CHW 和归一化都写入预分配的缓冲区
+        plan = self._plan(im0s.shape)
+        img = self.prepare(im0s, plan=plan).unsqueeze(0)  # 添加批次维度1*3x416x416
+
+        # ====== 推理 + 非极大值抑制(NMS) ======
+        # 用 export.py --nms 导出的模型在图中完成NMS
+        with torch.no_grad():
+            pred = self.backend.detect(img, self.conf_thres, self.iou_thres)  # 模型推理
+
+        # ====== 处理检测结果 ======
+        # 返回 det_dtype 结构化数组, 按置信度从高到低排列:
+        #   cls: 类别编号, 用 labels() 或 names 查名称 ('face', 'smoke', 'drink', 'phone'等)
+        #   conf: 置信度 (0-1)
         #   xyxy: 边界框坐标 (左上角x, 左上角y, 右下角x, 右下角y)
-    return ret
-
-
-# 根据检测的结果，在frame上标注classs和绘制方框
-def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True):
-    # 获取原始图像的宽高
-    shape = img.shape[:2]  # [高度, 宽度]
-    if isinstance(new_shape, int):
-        new_shape = (new_shape, new_shape)
-
-    # 计算缩放比例 (新尺寸/原尺寸)
-    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
-    if not scaleup:  # 如果禁止放大，确保比例≤1
-        r = min(r, 1.0)
-    # 计算新尺寸和填充
-    ratio = r, r  # 宽高比例
-    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))  # 缩放后尺寸
-    dw, dh = new_shape[1] - new_unpad[0], new_shape[0] - new_unpad[1]  # 需要填充的像素
-
-    if auto:  # 自动填充，确保尺寸是32的倍数(YOLO要求)
-        dw, dh = np.mod(dw, 32), np.mod(dh, 32)  # 取模32
-    elif scaleFill:  # 拉伸填充
-        dw, dh = 0.0, 0.0
-        new_unpad = (new_shape[1], new_shape[0])
-        ratio = new_shape[1] / shape[1], new_shape[0] / shape[0]
-    dw /= 2  # 将填充分为两侧
-    dh /= 2
-
-    # 调整图像大小
-    if shape[::-1] != new_unpad:  # 如果需要缩放
-        img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)  # 双线性插值
-
-    # 添加边框
-    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
-    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
-    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
-
-    return img, ratio, (dw, dh)
\ No newline at end of file
+        return self._package(pred[0], img.shape[2:], im0s.shape, plan['geometry'].ratio_pad)
+
+    # 检测结果转换到原图坐标后一次性拷贝到CPU, 打包成 det_dtype 结构化数组
+    def _package(self, det, img_shape, im0_shape, ratio_pad):
+        if len(det):
+            # 将边界框坐标从缩放后的图像尺寸转换回原始图像尺寸
+            det[:, :4] = scale_coords(img_shape, det[:, :4], im0_shape, ratio_pad).round()
+        det = det.float().cpu().numpy()
+        out = np.empty(len(det), dtype=det_dtype)
+        out['xyxy'] = det[:, :4]
+        out['conf'] = det[:, 4]
+        out['cls'] = det[:, 5]
+        return out
+
+    # 类别编号 -> 类别名称
+    def labels(self, det):
+        return [self.names[c] for c in det['cls']]
+
+    # 类别名称 -> 类别编号, 模型没有该类别时返回 -1
+    def class_id(self, name):
+        self.load()
+        return self.names.index(name) if name in self.names else -1
+
+    # 多路摄像头的帧一次前向推理, 每帧返回一个 det_dtype 结构化数组
+    def predict_batch(self, frames):
+        if not len(frames):
+            return []
+        self.load()
+        imgsz = self.imgsz
+        plans = [self._plan(im0.shape, imgsz=imgsz) for im0 in frames]
+        if len({plan['shape'] for plan in plans}) > 1:  # 尺寸不一致时统一填充到 imgsz x imgsz
+            plans = [self._plan(im0.shape, False, imgsz) for im0 in frames]
+        h, w = plans[0]['shape']
+
+        # 逐帧写入预分配的张量
+        img = self._get_input((len(frames), 3, h, w))
+        for i, (im0, plan) in enumerate(zip(frames, plans)):
+            self.prepare(im0, img[i], plan=plan)
+
+        with torch.no_grad():
+            pred = self.backend.detect(img, self.conf_thres, self.iou_thres)
+
+        return [self._package(det, img.shape[2:], im0.shape, plan['geometry'].ratio_pad)
+                for det, im0, plan in zip(pred, frames, plans)]
+
+
+# 默认引擎, 测试或其他工具可以替换为自己的 DetectorEngine
+engine = DetectorEngine()
+
+
+def load():
+    return engine.load()
+
+
+def preload():
+    return engine.preload()
+
+
+def predict(im0s):
+    return engine.predict(im0s)
+
+
+def predict_batch(frames):
+    return engine.predict_batch(frames)
+
+
+def labels(det):
+    return engine.labels(det)
@@ -3,6 +3,7 @@
 # 文件的出口处理后的帧
 import  time
 import  cv2
+import  numpy as np
 import  myfatigue
 import  mydetect
 _fps_state = {
@@ -11,71 +12,218 @@ _fps_state = {
     'last_update': time.time(),
     'fps': 0.0
 }
-def frametest(frame):
+# 融合模式: 先跑YOLO, 用它的 'face' 框作为dlib的人脸区域, 没有人脸框时才用dlib检测
+fused = True
+FACE_LABEL = 'face'
+
+
+
+# YOLO检测调度器: 特征点每帧都算, 打电话/喝水/抽烟这类持续数秒的行为不需要每帧检测,
+# YOLO每 stride 帧或每隔 interval 秒跑一次, 中间的帧沿用上一次的检测结果
+class DetectScheduler:
+    def __init__(self, stride=3, interval=None, track_boxes=True):
+        self.stride = stride  # 每隔多少帧检测一次, 1 表示每帧都检测
+        self.interval = interval  # 距上次检测超过多少秒时强制检测, None 表示不按时间调度
+        self.track_boxes = track_boxes  # 沿用检测框时是否随人脸的移动平移检测框
+        self.last_action = mydetect.empty_result()
+        self.last_run = 0.0
+        self.frames_since_run = stride  # 第一帧就运行YOLO, 融合模式启动时不必退回dlib全图检测
+        self.anchor = None  # 上次检测时的人脸中心
+
+    def should_run(self, now):
+        self.frames_since_run += 1
+        if self.frames_since_run >= self.stride:
+            return True
+        return self.interval is not None and now - self.last_run >= self.interval
+
+    def update(self, action, now):
+        self.last_action = action
+        self.last_run = now
+        self.frames_since_run = 0
+        self.anchor = None
+
+    # 返回沿用的检测结果, 按人脸中心的位移平移检测框(简易跟踪)
+    def carry(self, center):
+        if not self.track_boxes or self.anchor is None or center is None:
+            return self.last_action
+        dx, dy = center[0] - self.anchor[0], center[1] - self.anchor[1]
+        action = self.last_action.copy()
+        action['xyxy'] += np.array([dx, dy, dx, dy], dtype=np.float32)
+        return action
+
+
+scheduler = DetectScheduler()
+
+# 各阶段实际运行的频率(次/秒), 每秒更新一次
+_rate_state = {
+    'start_time': time.time(),
+    'counts': {'frame': 0, 'landmark': 0, 'detector': 0},
+    'rates': {'frame': 0.0, 'landmark': 0.0, 'detector': 0.0},
+}
+
+
+def stage_rates():
+    return dict(_rate_state['rates'])
+
+
+def _count_stage(name):
+    _rate_state['counts'][name] += 1
+
+
+def _update_rates(current_time):
+    elapsed = current_time - _rate_state['start_time']
+    if elapsed < 1.0:
+        return
+    for name, n in _rate_state['counts'].items():
+        _rate_state['rates'][name] = n / elapsed
+        _rate_state['counts'][name] = 0
+    _rate_state['start_time'] = current_time
+
+
+# 当前跟踪的人脸中心, 作为沿用检测框时的参考点
+def _face_center():
+    roi = myfatigue.tracker.roi
+    if roi is None:
+        return None
+    c = roi.center()
+    return c.x, c.y
+
+
+# 启动耗时: 从导入本模块到第一帧处理完成
+_startup_state = {
+    'import_time': time.time(),
+    'first_frame': None,
+}
+
+
+# 后台预加载dlib和YOLO模型, 和界面、摄像头的初始化并行进行
+def preload():
+    myfatigue.preload()
+    mydetect.preload()
+
+
+# 启动耗时统计(秒)
+def startup_stats():
+    stats = {'landmark_' + k: v for k, v in myfatigue.engine.stats.items()}
+    stats.update({'detector_' + k: v for k, v in mydetect.engine.stats.items()})
+    stats['first_frame'] = _startup_state['first_frame']
+    return stats
+
+
+# 只做分析不绘制, 不修改也不复制输入帧, 返回结构化结果:
+#   labels: 检测到的行为类别, action: YOLO检测结果(mydetect.det_dtype 结构化数组)
+#   shape: 驾驶员的68个特征点(没有人脸时为 None), metrics: landmark_metrics 指标
+#   ear / mar: 眼睛和嘴巴纵横比(没有人脸时为 None)
+def analyze(frame):
+    _fps_state['frame_count']+=1
+    current_time = time.time()
+    _count_stage('frame')
+    _update_rates(current_time)
+    run_detector = scheduler.should_run(current_time)
+    if run_detector:
+        # 在原始帧上检测, 融合模式下YOLO的人脸框直接交给特征点预测器
+        action = mydetect.predict(frame)
+        scheduler.update(action, current_time)
+        _count_stage('detector')
+        face_rects = [myfatigue.rect_from_xyxy(xyxy)
+                      for xyxy in action['xyxy'][action['cls'] == mydetect.engine.class_id(FACE_LABEL)]]
+        shape, metrics = myfatigue.analyze_face(frame, face_rects if fused else None)
+        scheduler.anchor = _face_center()
+    else:
+        # 跟踪模式下使用上一帧的人脸区域, 检测结果沿用上一次的
+        shape, metrics = myfatigue.analyze_face(frame)
+        action = scheduler.carry(_face_center())
+    _count_stage('landmark')
+
+    if _startup_state['first_frame'] is None:
+        _startup_state['first_frame'] = time.time() - _startup_state['import_time']
+        print(f"[INFO] 冷启动到首帧耗时: {_startup_state['first_frame']:.2f}s, {startup_stats()}")
+
+    # 每秒更新FPS
+    if current_time - _fps_state['last_update'] >= 1.0:
+        _fps_state['fps'] = _fps_state['frame_count'] / (
+                current_time - _fps_state['start_time'])  # 计算FPS = 帧数 / 时间间隔
+        _fps_state['frame_count'] = 0  # 重置帧计数器
+        _fps_state['start_time'] = current_time  # 更新开始时间和最后更新时间戳
+        _fps_state['last_update'] = current_time
+
+    return {
+        'labels': mydetect.labels(action),
+        'action': action,
+        'shape': shape,
+        'metrics': metrics,
+        'ear': float(metrics['ear']) if metrics is not None else None,
+        'mar': float(metrics['mar']) if metrics is not None else None,
+    }
+
+
+# 把分析结果转换成 frametest 原来的返回格式 [标签列表, EAR, MAR], 没有人脸时为空列表
+def result_to_ret(result):
+    if result['ear'] is None:
+        return []
+    return [result['labels'], round(result['ear'], 3), round(result['mar'], 3)]
+
+
+# 绘制分析结果; scale < 1 时先缩小出一份显示用的副本再绘制, 原始帧保持不变;
+# dst 为预分配的显示缓冲区, 给定时缩小到它的尺寸, 不再每帧分配
+def render(frame, result, scale=1.0, dst=None):
+    if dst is not None:
+        scale = dst.shape[1] / frame.shape[1]
+        frame = cv2.resize(frame, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+    elif scale != 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    # 确保帧可写（处理UMat等特殊情况）检查帧是否可写（某些OpenCV操作会产生只读或特殊格式的帧）
+    elif not getattr(frame, 'flags', None) or not frame.flags.writeable:
+        frame = frame.copy()
+    if result['shape'] is not None:
+        shape = result['shape'] if scale == 1.0 else (result['shape'] * scale).astype(int)
+        myfatigue.draw_facial_features(frame, shape)
+    detect_action(frame, [], result['action'], scale)
+    # 添加FPS显示（BGR格式红色文字）
+    cv2.putText(
+        img=frame,
+        text=f"FPS:{_fps_state['fps']:.1f}",
+        org=(10, 30),
+        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+        fontScale=0.7,
+        color=(0, 0, 255),
+        thickness=2,
+        lineType=cv2.LINE_AA
+    )
+    return frame
+
+
+# draw 为 False 时只分析不绘制(无界面部署)
+def frametest(frame, draw=True):
     # 返回检测到的结果
     ret = []
-    labellist= []
     if frame is None or not hasattr(frame,'shape'):
         return frame
     try:
-        _fps_state['frame_count']+=1
-        current_time = time.time()
-        # 调用dlib库检测人脸并绘制人脸的轮廓
-        frame,eyear,mouthar= myfatigue.detect_fatigue(frame)
-        labellist,frame= detect_action(frame,labellist)
-
-
-        #print("ear:"+str(eyear)+"mar"+str(mouthar))
-        ret.append(labellist)
-        ret.append(round(eyear,3))
-        ret.append(round(mouthar, 3))
-
-
-
-
-        # 每秒更新FPS
-        if current_time - _fps_state['last_update'] >= 1.0:
-            _fps_state['fps'] = _fps_state['frame_count'] / (
-                    current_time - _fps_state['start_time'])  # 计算FPS = 帧数 / 时间间隔
-            _fps_state['frame_count'] = 0  # 重置帧计数器
-            _fps_state['start_time'] = current_time  # 更新开始时间和最后更新时间戳
-            _fps_state['last_update'] = current_time
-        # 确保帧可写（处理UMat等特殊情况）检查帧是否可写（某些OpenCV操作会产生只读或特殊格式的帧）
-        if not getattr(frame, 'flags', None) or not frame.flags.writeable:
-            frame = frame.copy()
-            # 添加FPS显示（BGR格式红色文字）
-        cv2.putText(
-            img=frame,
-            text=f"FPS:{_fps_state['fps']:.1f}",
-            org=(10, 30),
-            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale=0.7,
-            color=(0, 0, 255),
-            thickness=2,
-            lineType=cv2.LINE_AA
-        )
+        result = analyze(frame)
+        ret = result_to_ret(result)
+        if draw:
+            frame = render(frame, result)
         return frame,ret
 
     except Exception as e:
         return  frame,ret
 
 
-def detect_action(frame,labellist):
-    action=mydetect.predict(frame)
-    for label, prob, xyxy in action:
+# action 为已有的检测结果, 为空时调用模型检测; scale 为绘制时的缩放比例
+def detect_action(frame,labellist,action=None,scale=1.0):
+    if action is None:
+        action=mydetect.predict(frame)
+    labels = mydetect.labels(action)
+    boxes = (action['xyxy'] * scale).astype(int)  # 所有框一次缩放取整
+    probs = np.round(action['conf'].astype(np.float64) * 100, 2)  # 置信度百分比(保留2位小数)
+    for label, prob, (left, top, right, bottom) in zip(labels, probs.tolist(), boxes.tolist()):
         # 在labellist加入当前label
         labellist.append(label)
         # 将标签和置信度何在一起
         text = label + str(prob)
         # 画出识别框
-        left = int(xyxy[0])
-        top = int(xyxy[1])
-        right = int(xyxy[2])
-        bottom = int(xyxy[3])
         cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 1)
         # 在框的左上角画出标签和置信度
         cv2.putText(frame, text, (left, top - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 3)
     return labellist, frame
-
-
-
@@ -1,5 +1,8 @@
 # 调用dlib库检测人脸特征点
 
+import threading
+import time
+
 from imutils import face_utils
 import  numpy as np
 import  dlib
@@ -10,10 +13,165 @@ import scipy.spatial.distance as dist
 (rStart, rEnd) = face_utils.FACIAL_LANDMARKS_IDXS["right_eye"]
 (mStart, mEnd) = face_utils.FACIAL_LANDMARKS_IDXS["mouth"]
 
-# 初始化DLIB的人脸检测器和面部标志点预测器
-print("[INFO] loading facial landmark predictor...")
-detector=dlib.get_frontal_face_detector()
-predictor=dlib.shape_predictor("weights/shape_predictor_68_face_landmarks.dat")
+predictor_path = "weights/shape_predictor_68_face_landmarks.dat"  # 68点特征点模型
+detect_scale = 1.0  # 人脸检测的缩放比例, 如0.5表示在一半分辨率上检测, 可用 benchmark.py detect-scale 选择
+# 驾驶员座位区域 (x1, y1, x2, y2), 取值0-1, 相对于送入检测的(已镜像的)画面;
+# 画面中有多张人脸时选离该区域中心最近的一张, 为 None 时选最大的人脸
+seat_region = None
+
+
+# DLIB的人脸检测器和面部标志点预测器, 导入时不加载, 第一次使用或显式调用 load() 时才加载
+class LandmarkEngine:
+    def __init__(self, predictor_path=predictor_path):
+        self.predictor_path = predictor_path
+        self.detector = None
+        self.predictor = None
+        self.stats = {}  # 启动耗时统计(秒)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self.predictor is not None
+
+    def load(self):
+        if self.loaded:
+            return self
+        with self._lock:
+            if self.loaded:
+                return self
+            print("[INFO] loading facial landmark predictor...")
+            t0 = time.time()
+            self.detector = dlib.get_frontal_face_detector()
+            self.predictor = dlib.shape_predictor(self.predictor_path)
+            self.stats['load'] = time.time() - t0
+            print(f"[INFO] landmark predictor loaded in {self.stats['load']:.2f}s")
+        return self
+
+    # 在后台线程中加载模型
+    def preload(self):
+        if not self.loaded and self._thread is None:
+            self._thread = threading.Thread(target=self.load, daemon=True)
+            self._thread.start()
+        return self
+
+
+# 默认引擎, 测试或其他工具可以替换为自己的 LandmarkEngine
+engine = LandmarkEngine()
+
+
+def load():
+    return engine.load()
+
+
+def preload():
+    return engine.preload()
+
+
+# 人脸区域跟踪: 检测到人脸后, 后续帧直接用上一帧特征点的外接框作为ROI,
+# 只跑特征点预测器; 每隔 redetect_interval 帧或特征点漂移时才重新全图检测
+class FaceTracker:
+    def __init__(self, redetect_interval=10, min_iou=0.5, enabled=True, detect_scale=1.0):
+        self.redetect_interval = redetect_interval  # 强制全图检测的间隔帧数
+        self.min_iou = min_iou  # 特征点外接框与ROI的最小IoU, 低于该值认为跟丢
+        self.enabled = enabled
+        self.detect_scale = detect_scale  # 人脸检测时的缩放比例, 特征点仍在原分辨率上预测
+        self.reset()
+        # 各阶段的调用次数和累计耗时(秒)
+        self.stage_stats = {name: [0, 0.0] for name in ('detect', 'track', 'external', 'landmark')}
+
+    def reset(self):
+        self.roi = None  # 跟踪使用的人脸框 dlib.rectangle
+        self.frames_since_detect = 0
+
+    def reset_stats(self):
+        for v in self.stage_stats.values():
+            v[:] = [0, 0.0]
+
+    # 返回本帧用于特征点预测的人脸框列表; 外部(如YOLO)给出人脸框时直接使用, 不再检测
+    def face_rects(self, gray, external_rects=None):
+        t = time.time()
+        if external_rects:
+            self.frames_since_detect = 0
+            self.add_stage('external', t)
+            return external_rects
+        if self.enabled and self.roi is not None and self.frames_since_detect < self.redetect_interval:
+            self.frames_since_detect += 1
+            self.add_stage('track', t)
+            return [self.roi]
+        rects = self.detect(gray)
+        self.frames_since_detect = 0
+        self.add_stage('detect', t)
+        return rects
+
+    # 在缩小后的灰度图上检测人脸, 再把人脸框映射回原分辨率
+    def detect(self, gray):
+        s = self.detect_scale
+        if s == 1.0:
+            return list(engine.detector(gray, 0))
+        small = cv2.resize(gray, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+        return [dlib.rectangle(int(r.left() / s), int(r.top() / s), int(r.right() / s), int(r.bottom() / s))
+                for r in engine.detector(small, 0)]
+
+    # 用本帧的特征点更新ROI, 特征点和ROI偏离太大时放弃跟踪, 下一帧重新检测
+    def update(self, rect, shape, frame_shape):
+        if shape is None:
+            self.reset()
+            return
+        h, w = frame_shape[:2]
+        x1, y1 = shape.min(0)
+        x2, y2 = shape.max(0)
+        roi = dlib.rectangle(int(max(0, x1)), int(max(0, y1)), int(min(w - 1, x2)), int(min(h - 1, y2)))
+        if roi.area() <= 0 or _rect_iou(roi, rect) < self.min_iou:
+            self.reset()
+            return
+        self.roi = roi
+
+    def add_stage(self, name, t):
+        self.stage_stats[name][0] += 1
+        self.stage_stats[name][1] += time.time() - t
+
+    # 各阶段平均耗时(毫秒)和跳过的全图检测次数
+    def timing_stats(self):
+        stats = {name: {'count': n, 'mean_ms': round(total / n * 1000, 2) if n else 0.0}
+                 for name, (n, total) in self.stage_stats.items()}
+        detect = stats['detect']
+        stats['saved_ms'] = round(stats['track']['count'] * (detect['mean_ms'] - stats['track']['mean_ms']), 1)
+        return stats
+
+    # 用于日志的一行摘要
+    def timing_summary(self):
+        stats = self.timing_stats()
+        stages = ', '.join(f"{name} {stats[name]['count']}次/{stats[name]['mean_ms']}ms"
+                           for name in ('detect', 'track', 'external', 'landmark'))
+        return f"人脸阶段 {stages}, 跟踪节省 {stats['saved_ms']}ms"
+
+
+# 多张人脸时选出驾驶员, 只对驾驶员的人脸做特征点预测
+def select_driver(rects, frame_shape, region=None):
+    if len(rects) == 0:
+        return None
+    if len(rects) == 1:
+        return rects[0]
+    if region is None:
+        return max(rects, key=lambda r: r.area())
+    h, w = frame_shape[:2]
+    cx, cy = (region[0] + region[2]) / 2 * w, (region[1] + region[3]) / 2 * h
+    return min(rects, key=lambda r: (r.center().x - cx) ** 2 + (r.center().y - cy) ** 2)
+
+
+# 把检测框 (x1, y1, x2, y2) 转换成 dlib.rectangle
+def rect_from_xyxy(xyxy):
+    return dlib.rectangle(int(xyxy[0]), int(xyxy[1]), int(xyxy[2]), int(xyxy[3]))
+
+
+def _rect_iou(a, b):
+    inter = a.intersect(b).area()  # 不相交时 area() 为 0
+    union = a.area() + b.area() - inter
+    return inter / union if union > 0 else 0.0
+
+
+tracker = FaceTracker(detect_scale=detect_scale)
 
 
 # 检测人脸特征点，并且绘制特征点
@@ -38,31 +196,71 @@ def  draw_facial_features(frame,shape):
     return frame
 
 
-# 检测人脸
-def detect_fatigue(frame):
+# 检测人脸, face_rects 为外部给出的人脸框(dlib.rectangle), 为空时才用dlib检测
+def detect_fatigue(frame, face_rects=None):
+    shape, metrics = analyze_face(frame, face_rects)
+    if metrics is not None:
+        eyear, mouthar = float(metrics['ear']), float(metrics['mar'])
+    frame = draw_facial_features(frame,shape)
+    return frame,eyear,mouthar
+
+
+# 只做分析不绘制: 返回驾驶员的68个特征点和 landmark_metrics 指标, 没有人脸时返回 (None, None)
+def analyze_face(frame, face_rects=None):
     # 图像的灰度化
-    gray = cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY)
-    # 检测人脸信息
-    rects = detector(gray,0)
+    gray = cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    engine.load()
+    # 检测人脸信息, 跟踪模式下直接使用上一帧的人脸区域
+    rects = tracker.face_rects(gray, face_rects)
+    # 只保留驾驶员的人脸, 跟踪模式下之后的帧会一直跟随这张人脸
+    rect = select_driver(rects, gray.shape, seat_region)
     shape = None
+    metrics = None
 
     # 从检测信息中提取人脸的特征点
-    for rect in rects:
-        shape = predictor(gray,rect)
+    if rect is not None:
+        t = time.time()
+        shape = engine.predictor(gray,rect)
         shape = face_utils.shape_to_np(shape)
+        tracker.add_stage('landmark', t)
+        metrics = landmark_metrics(shape)
 
-        # 计算两只眼睛的比例
-        left_eye = shape[lStart:lEnd]
-        right_eye = shape[rStart:rEnd]
-        eyear = (calculate_eye_aspect_ratio(left_eye)+calculate_eye_aspect_ratio(right_eye))/2.0
+    tracker.update(rect, shape, gray.shape)
+    return shape, metrics
 
-        # 计算嘴巴的比例
-        mouth = shape[mStart:mEnd]
-        mouthar = calculate_mouth_aspect_ratio(mouth)
 
+# 根据68个特征点计算两只眼睛的平均EAR和嘴巴的MAR
+def calculate_ratios(shape):
+    m = landmark_metrics(shape)
+    return float(m['ear']), float(m['mar'])
 
-    frame = draw_facial_features(frame,shape)
-    return frame,eyear,mouthar
+
+# 一次计算所需的全部点对距离, 每行为 (起点, 终点) 在68个特征点中的下标
+_metric_pairs = np.array([
+    (43, 47), (44, 46), (42, 45),  # 左眼: 两条垂直距离, 一条水平距离
+    (37, 41), (38, 40), (36, 39),  # 右眼
+    (50, 58), (52, 56), (48, 54),  # 嘴巴: 两条垂直距离, 一条水平距离
+    (36, 45),  # 两眼外眼角距离
+])
+
+# 特征点几何指标: 左右眼EAR, 平均EAR, MAR, 嘴宽/眼距, 两眼连线的倾斜角(度)
+metrics_dtype = np.dtype([('ear_left', np.float32), ('ear_right', np.float32), ('ear', np.float32),
+                          ('mar', np.float32), ('mouth_width', np.float32), ('roll', np.float32)])
+
+
+# 向量化计算特征点几何指标, shape 可以是单帧 (68,2) 或回放用的 (T,68,2)
+def landmark_metrics(shape):
+    pts = np.asarray(shape, dtype=np.float32)
+    d = np.linalg.norm(pts[..., _metric_pairs[:, 0], :] - pts[..., _metric_pairs[:, 1], :], axis=-1)
+    out = np.empty(pts.shape[:-2], dtype=metrics_dtype)
+    out['ear_left'] = (d[..., 0] + d[..., 1]) / (2.0 * d[..., 2])
+    out['ear_right'] = (d[..., 3] + d[..., 4]) / (2.0 * d[..., 5])
+    out['ear'] = (out['ear_left'] + out['ear_right']) / 2.0
+    out['mar'] = (d[..., 6] + d[..., 7]) / (2.0 * d[..., 8])
+    out['mouth_width'] = d[..., 8] / d[..., 9]
+    v = pts[..., 45, :] - pts[..., 36, :]
+    out['roll'] = np.degrees(np.arctan2(v[..., 1], v[..., 0]))
+    return out
 
 
 #计算眼睛的EAR
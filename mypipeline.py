@@ -0,0 +1,131 @@
+# 采集流水线
+# 采集线程只保留最新的一帧, 推理跟不上时旧帧直接丢弃, 保证显示延迟有上限
+import threading
+import time
+from collections import deque
+
+
+class LatestFrameGrabber:
+    """独立线程读取摄像头, 只保留最新帧; 未被取走就被覆盖的帧计入 dropped"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.frame = None
+        self.frame_time = 0.0  # 最新帧的采集时间戳
+        self.captured = 0  # 采集到的总帧数
+        self.dropped = 0  # 被新帧覆盖而没有被处理的帧数
+        self.skipped = 0  # 为了限制采集帧率而没有解码的帧数
+        self.interval = 0.0  # 两次采集之间的平均间隔(秒), 0 表示按摄像头帧率采集
+        self.tolerance = 0.25  # 帧提前到达不超过 tolerance * interval 时仍然采集, 吸收摄像头帧间隔的抖动
+        self._fresh = False  # 最新帧是否还没被取走
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    # 按截止时间限速: 每采集一帧截止时间推后一个间隔, 平均帧率等于 1/interval, 抖动不会累积成丢帧;
+    # 落后超过一个间隔(卡顿或切换了工作点)时从当前时间重新对齐, 不会连续补帧
+    def _run(self):
+        next_due = 0.0
+        while self._running:
+            # grab 只取帧不解码, 限速时持续 grab 让摄像头缓冲区保持最新
+            if not self.cap.grab():
+                time.sleep(0.01)
+                continue
+            now = time.time()
+            if now < next_due - self.tolerance * self.interval:
+                self.skipped += 1
+                continue
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+            next_due = max(next_due + self.interval, now)
+            with self._cond:
+                if self._fresh:
+                    self.dropped += 1
+                self.frame = frame
+                self.frame_time = now
+                self.captured += 1
+                self._fresh = True
+                self._cond.notify()
+
+    def read(self, timeout=1.0):
+        """等待一帧还没处理过的新帧, 返回 (frame, 采集时间戳); 超时或已停止返回 (None, 0.0)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._fresh or not self._running, timeout)
+            if not self._fresh:
+                return None, 0.0
+            self._fresh = False
+            return self.frame, self.frame_time
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+# 自适应帧率控制: 根据端到端延迟在若干档位之间切换,
+# 档位越高, 采集帧率越低、YOLO检测间隔越大、检测输入尺寸越小
+class AdaptiveRateController:
+    default_levels = [
+        {'capture_fps': 30, 'detector_stride': 1, 'imgsz': 640},
+        {'capture_fps': 30, 'detector_stride': 3, 'imgsz': 640},
+        {'capture_fps': 20, 'detector_stride': 3, 'imgsz': 512},
+        {'capture_fps': 15, 'detector_stride': 5, 'imgsz': 416},
+        {'capture_fps': 10, 'detector_stride': 8, 'imgsz': 320},
+    ]
+
+    def __init__(self, target_latency=0.15, levels=None, level=1, window=30, cooldown=2.0):
+        self.target_latency = target_latency  # 目标端到端延迟(秒)
+        self.levels = levels or self.default_levels
+        self.level = level
+        self.window = window  # 参与统计的帧数
+        self.cooldown = cooldown  # 两次切换档位之间的最短间隔(秒)
+        self.upper = 1.1  # 延迟超过目标的 1.1 倍时降档
+        self.lower = 0.6  # 延迟低于目标的 0.6 倍时升档
+        self.latencies = deque(maxlen=window)
+        self.stage_times = {}  # 各阶段最近的耗时(秒)
+        self.last_change = time.time()
+
+    # 记录一帧的端到端延迟
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+
+    # 记录某个阶段的耗时
+    def record_stage(self, name, seconds):
+        if name not in self.stage_times:
+            self.stage_times[name] = deque(maxlen=self.window)
+        self.stage_times[name].append(seconds)
+
+    def mean_latency(self):
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    # 根据最近的延迟调整档位, 档位变化时返回新的工作点, 否则返回 None
+    def update(self, now=None):
+        now = time.time() if now is None else now
+        if len(self.latencies) < self.window // 2 or now - self.last_change < self.cooldown:
+            return None
+        latency = self.mean_latency()
+        if latency > self.target_latency * self.upper and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif latency < self.target_latency * self.lower and self.level > 0:
+            self.level -= 1
+        else:
+            return None
+        self.latencies.clear()
+        self.last_change = now
+        return self.operating_point()
+
+    # 当前工作点: 档位参数、平均延迟和各阶段平均耗时(毫秒)
+    def operating_point(self):
+        op = dict(self.levels[self.level], level=self.level, latency_ms=round(self.mean_latency() * 1000, 1))
+        op['stages_ms'] = {name: round(sum(v) / len(v) * 1000, 1) for name, v in self.stage_times.items() if v}
+        return op
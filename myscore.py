@@ -0,0 +1,313 @@
+# 疲劳评分: 自适应阈值和疲劳状态判断, 不依赖Qt, 界面和离线回放共用
+import time
+from collections import deque
+
+import numpy as np
+
+from config import config, DriverProfileStore
+
+
+# 增量分位数估计: 每个样本 O(1) 更新, 不保存历史, 对旧数据自然遗忘
+class IncrementalQuantile:
+    def __init__(self, q=0.5, lr=0.002):
+        self.q = q  # 分位数 (0-1)
+        self.lr = lr  # 每次更新的步长
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        elif x < self.value:
+            self.value -= self.lr * (1 - self.q)
+        else:
+            self.value += self.lr * self.q
+        return self.value
+
+
+# 自适应阈值计算器
+# 预分配的环形缓冲区 + 滑动求和/平方和, 每帧 O(1);
+# window_seconds 为 None 时按帧数(buff_size)统计, 否则按时间窗口统计;
+# percentile 不为 None 时阈值取 EAR 分位数乘以 percentile_factor
+class AdaptiveThresholdCalculator:
+    def __init__(self, init_eye_thresh=0.26, buff_size=30, window_seconds=None, max_fps=60,
+                 percentile=None, percentile_factor=0.75):
+        self.eye_thresh = init_eye_thresh
+        self.window_seconds = window_seconds
+        self.buff_size = buff_size if window_seconds is None else int(window_seconds * max_fps) + 1
+        self.eye_buffer = np.zeros(self.buff_size)
+        self.time_buffer = np.zeros(self.buff_size)
+        self.head = 0  # 下一个写入位置
+        self.count = 0  # 缓冲区中的样本数
+        self.eye_sum = 0.0
+        self.eye_sq_sum = 0.0
+        self.ready = False  # 是否已经积累了一个完整窗口
+
+        self.eye_adjust_factor = 0.05
+        self.min_eye_thresh = 0.15
+        self.max_eye_thresh = 0.35
+
+        self.percentile_factor = percentile_factor
+        self.quantile = IncrementalQuantile(percentile / 100.0) if percentile is not None else None
+
+    # 移出最旧的样本
+    def _pop_oldest(self):
+        tail = (self.head - self.count) % self.buff_size
+        x = self.eye_buffer[tail]
+        self.eye_sum -= x
+        self.eye_sq_sum -= x * x
+        self.count -= 1
+
+    def _push(self, eye_ar, timestamp):
+        if self.count == self.buff_size:
+            self._pop_oldest()
+            self.ready = True
+        self.eye_buffer[self.head] = eye_ar
+        self.time_buffer[self.head] = timestamp
+        self.head = (self.head + 1) % self.buff_size
+        self.count += 1
+        self.eye_sum += eye_ar
+        self.eye_sq_sum += eye_ar * eye_ar
+
+        if self.window_seconds is not None:
+            oldest = timestamp - self.window_seconds
+            while self.count > 1 and self.time_buffer[(self.head - self.count) % self.buff_size] <= oldest:
+                self._pop_oldest()
+                self.ready = True
+        elif self.count == self.buff_size:
+            self.ready = True
+
+    @property
+    def eye_mean(self):
+        return self.eye_sum / self.count if self.count else 0.0
+
+    @property
+    def eye_std(self):
+        if not self.count:
+            return 0.0
+        return float(np.sqrt(max(0.0, self.eye_sq_sum / self.count - self.eye_mean ** 2)))
+
+    def update_thresholds(self, eye_ar, timestamp=None):
+        # 记录眼睛纵横比数据
+        self._push(eye_ar, time.time() if timestamp is None else timestamp)
+        if self.quantile is not None:
+            self.quantile.update(eye_ar)
+        if not self.ready:
+            return self.eye_thresh
+
+        if self.quantile is not None:
+            thresh = self.quantile.value * self.percentile_factor
+            self.eye_thresh = min(self.max_eye_thresh, max(self.min_eye_thresh, thresh))
+            return self.eye_thresh
+
+        eye_mean = self.eye_mean
+        if eye_mean < self.eye_thresh - 0.1:
+            self.eye_thresh = max(self.min_eye_thresh, self.eye_thresh-self.eye_adjust_factor)
+
+        elif eye_mean > self.eye_thresh + 0.1:
+            self.eye_thresh = min(self.max_eye_thresh, self.eye_thresh + self.eye_adjust_factor)
+
+        return self.eye_thresh
+
+
+# 疲劳检测类
+class FatiguDetector:
+    def __init__(self, driver_id=None, profile_store=None):
+        self.thresholds_cal = AdaptiveThresholdCalculator()
+        # 眼睛参数
+        self.EYE_AR_FRAMES = 2
+
+        # 嘴巴参数
+        self.MAR_THRESH = 0.65
+        self.MOUTH_AR_FRAME = 3
+
+        # 疲劳参数
+        self.FATIGUE_THRESHOLD = 0.30
+        self.WARNING_THRESHOLD = 0.15
+
+        # 上次评估时间, 从第一帧的时间戳开始计时; 回放时时间戳从视频开头算起, 不能用 time.time()
+        self.last_check_time = None
+        # 上次的疲劳时间
+        self.last_fatigue_time = float('-inf')
+        # 上次的警告时间
+        self.last_warning_time = float('-inf')
+
+        # 初始化计数器
+        self.reset_count()
+
+        # 每隔2秒评估一次疲劳状态
+        self.FATIGUE_CHECK_INTERVAL = 2.0
+        # 状态维持 30 秒
+        self.STATUS_MAINTAIN_DURATION = 30.0
+
+        # 按真实时间统计闭眼(PERCLOS)和张嘴的时间占比, 与帧率无关
+        self.SCORE_WINDOW = 2.0  # 统计窗口(秒)
+        self.MAX_FRAME_GAP = 0.5  # 单帧最多代表的时长(秒), 防止卡顿或丢脸后的长间隔被整段计入
+        self.reset_window()
+
+        # 驾驶员标定: 已有标定结果时直接使用, 否则先采集 CALIBRATION_SECONDS 秒的数据
+        self.CALIBRATION_SECONDS = config.CALIBRATION_SECONDS
+        self.EYE_THRESH_RATIO = 0.75  # 闭眼阈值 = 睁眼EAR基线 * 0.75
+        self.MAR_MARGIN = 0.3  # 张嘴阈值 = 闭嘴MAR基线 + 0.3
+        self.profile_store = profile_store or DriverProfileStore(config.PROFILE_PATH)
+        self.select_driver(driver_id or config.DRIVER_ID)
+
+
+    # 重置计数器
+    def reset_count(self):
+        self.eye_count = 0
+        self.total_eye_closed = 0
+        self.eye_cycle_count = 0
+        self.thirty_sec_eye = 0  # 新增
+
+        self.mouth_counter = 0
+        self.total_mouth_open = 0
+        self.mouth_cycle_count = 0
+        self.thirty_sec_mouth = 0  # 新增
+
+
+    # 切换驾驶员: 有标定结果时直接使用, 没有或 recalibrate 为 True 时重新标定
+    def select_driver(self, driver_id, recalibrate=False):
+        self.driver_id = driver_id
+        profile = self.profile_store.get(driver_id)
+        if profile and not recalibrate:
+            self.apply_profile(profile)
+            print(f'已加载驾驶员 {driver_id} 的标定结果: {profile}')
+        else:
+            self.start_calibration()
+
+    # 开始标定, 之后 CALIBRATION_SECONDS 秒内的 EAR/MAR 用于计算该驾驶员的基线
+    def start_calibration(self):
+        self.calibrating = True
+        self.profile = None
+        self.calibration_start = None
+        self.calibration_ear = []
+        self.calibration_mar = []
+        print(f'开始标定驾驶员 {self.driver_id}, 请保持正常驾驶 {self.CALIBRATION_SECONDS:.0f} 秒')
+
+    def _calibrate(self, eyear, mouthar, timestamp):
+        if self.calibration_start is None:
+            self.calibration_start = timestamp
+        self.calibration_ear.append(eyear)
+        self.calibration_mar.append(mouthar)
+        if timestamp - self.calibration_start < self.CALIBRATION_SECONDS:
+            return
+        # 用中位数作为睁眼EAR和闭嘴MAR的基线, 少量眨眼和说话不会影响结果
+        ear_baseline = float(np.median(self.calibration_ear))
+        mar_baseline = float(np.median(self.calibration_mar))
+        cal = self.thresholds_cal
+        eye_thresh = min(cal.max_eye_thresh, max(cal.min_eye_thresh, ear_baseline * self.EYE_THRESH_RATIO))
+        profile = {
+            'ear_baseline': round(ear_baseline, 4),
+            'mar_baseline': round(mar_baseline, 4),
+            'eye_thresh': round(eye_thresh, 4),
+            'mar_thresh': round(mar_baseline + self.MAR_MARGIN, 4),
+            'samples': len(self.calibration_ear),
+        }
+        self.calibrating = False
+        self.calibration_ear, self.calibration_mar = [], []
+        self.apply_profile(profile)
+        self.profile_store.put(self.driver_id, profile)
+        print(f'驾驶员 {self.driver_id} 标定完成: {profile}')
+
+    def apply_profile(self, profile):
+        self.calibrating = False
+        self.thresholds_cal.eye_thresh = profile['eye_thresh']
+        self.MAR_THRESH = profile['mar_thresh']
+        self.profile = profile
+
+    # 清空时间窗口, 未检测到人脸时调用
+    def reset_window(self):
+        self.samples = deque()  # 环形缓冲区: (时间戳, 时长, 是否闭眼, 是否张嘴, EAR, MAR)
+        self.window_time = 0.0
+        self.closed_time = 0.0
+        self.open_time = 0.0
+        self.last_timestamp = None
+        self._reset_cycle_count()
+
+    # 加入一帧, 并移出窗口之外的旧帧, 每帧摊还 O(1)
+    def _push_sample(self, timestamp, closed, opened, eyear, mouthar):
+        dt = 0.0 if self.last_timestamp is None else min(max(0.0, timestamp - self.last_timestamp), self.MAX_FRAME_GAP)
+        self.last_timestamp = timestamp
+        self.samples.append((timestamp, dt, closed, opened, eyear, mouthar))
+        self.window_time += dt
+        self.closed_time += dt if closed else 0.0
+        self.open_time += dt if opened else 0.0
+
+        while self.samples and self.samples[0][0] <= timestamp - self.SCORE_WINDOW:
+            _, dt, closed, opened, _, _ = self.samples.popleft()
+            self.window_time -= dt
+            self.closed_time -= dt if closed else 0.0
+            self.open_time -= dt if opened else 0.0
+
+    # 检测疲劳状态, 'normal'、'warning'、“fatigue”
+    # timestamp 为这一帧的采集时间, 默认取当前时间
+    def detec_fatigue(self, eyear, mouthar, timestamp=None):
+        current_time = time.time() if timestamp is None else timestamp
+        if self.calibrating:
+            self._calibrate(eyear, mouthar, current_time)
+        # 获取自适应阈值
+        self.EYE_AR_THRESH = self.thresholds_cal.update_thresholds(eyear, current_time)
+
+        # print(f"EYE_AR{self.EYE_AR_THRESH}, eyear: {eyear}")
+
+        if eyear < self.EYE_AR_THRESH:
+            self.eye_count += 1
+            self.eye_cycle_count +=1
+        else:
+            if self.eye_count>=self.EYE_AR_FRAMES:
+                self.total_eye_closed += 1
+                self.thirty_sec_eye += 1
+            self.eye_count = 0
+
+        if mouthar > self.MAR_THRESH:
+            self.mouth_counter += 1
+            self.mouth_cycle_count += 1
+        else:
+            if self.mouth_counter >= self.MOUTH_AR_FRAME:
+                self.total_mouth_open += 1
+                self.thirty_sec_mouth += 1
+            self.mouth_counter = 0
+        self._push_sample(current_time, eyear < self.EYE_AR_THRESH, mouthar > self.MAR_THRESH, eyear, mouthar)
+        current_status = 'normal'
+
+        if self.last_check_time is None:
+            self.last_check_time = current_time
+        if current_time - self.last_check_time >= self.FATIGUE_CHECK_INTERVAL:
+            # 疲劳分数计算
+            fatigue_score = self.cal_fatigue_score()
+            print(f'疲劳分数: {fatigue_score}')
+
+            # 复位
+            self._reset_cycle_count()
+            self.last_check_time = current_time
+
+            # 根据疲劳状态，提醒
+            if fatigue_score > self.FATIGUE_THRESHOLD:
+                self.last_fatigue_time = current_time
+                print("检测到疲劳状态")
+            elif fatigue_score > self.WARNING_THRESHOLD:
+                self.last_warning_time = current_time
+                print("检测到警告状态")
+
+        if current_time - self.last_fatigue_time < self.STATUS_MAINTAIN_DURATION:
+            return 'fatigue'
+        elif current_time - self.last_warning_time < self.STATUS_MAINTAIN_DURATION:
+            return 'warning'
+        else:
+            return current_status
+
+
+    # 计算疲劳分数: 统计窗口内闭眼时间占比(PERCLOS)和张嘴时间占比
+    def cal_fatigue_score(self):
+        window_time = max(1e-6, self.window_time)
+        eye_ratio = min(1, max(0.0, self.closed_time) / window_time)  # 累加和有浮点误差, 限制在 [0, 1]
+        mouth_ratio = min(1, max(0.0, self.open_time) / window_time)
+
+        print(f'闭眼帧数{self.eye_cycle_count}, 张嘴帧数: {self.mouth_cycle_count}, 统计时长: {self.window_time:.2f}s')
+        print(f'闭眼比例: {eye_ratio}, 张嘴比例: {mouth_ratio}')
+
+        return 0.8*eye_ratio + 0.2*mouth_ratio
+    # 重置计数
+    def _reset_cycle_count(self):
+        self.eye_cycle_count = 0
+        self.mouth_cycle_count = 0
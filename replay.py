@@ -0,0 +1,145 @@
+"""Replays recorded videos or image folders through the fatigue pipeline without Qt
+
+Every frame is analysed (batched YOLO + dlib landmarks + FatiguDetector), nothing is drawn, and per-frame
+metrics are written as one column-per-array .npz file per source.
+
+Usage:
+    $ python replay.py --source recordings/*.mp4 --out runs/replay --batch-size 8
+"""
+
+import argparse
+import glob
+import os
+import queue
+import time
+from pathlib import Path
+from threading import Thread
+
+import numpy as np
+
+import mydetect
+import myfatigue
+from config import DriverProfileStore
+from myscore import FatiguDetector
+from utils.datasets import iter_frames, vid_formats
+
+status_codes = {'normal': 0, 'warning': 1, 'fatigue': 2}
+
+
+# 后台解码线程, 提前把帧解码到队列中: (帧序号, 时间戳(秒), 帧), 结束时放入 None
+class FrameReader(Thread):
+    def __init__(self, source, fps=30.0, queue_size=64):
+        super().__init__(daemon=True)
+        self.source = source
+        self.fps = fps  # 图片目录或视频缺少时间戳时使用的帧率
+        self.frames = queue.Queue(maxsize=queue_size)
+
+    def run(self):
+        try:
+            for item in iter_frames(self.source, self.fps):
+                self.frames.put(item)
+        finally:
+            self.frames.put(None)
+
+
+# 列式保存的每帧指标
+class ReplayColumns:
+    def __init__(self):
+        self.columns = {k: [] for k in ('frame', 'timestamp', 'face', 'ear', 'mar', 'ear_left', 'ear_right',
+                                        'roll', 'status', 'classes')}
+
+    def append(self, frame, timestamp, metrics, status, classes):
+        c = self.columns
+        c['frame'].append(frame)
+        c['timestamp'].append(timestamp)
+        c['face'].append(metrics is not None)
+        for k in ('ear', 'mar', 'ear_left', 'ear_right', 'roll'):
+            c[k].append(float(metrics[k]) if metrics is not None else np.nan)
+        c['status'].append(status_codes[status])
+        c['classes'].append(classes)
+
+    def __len__(self):
+        return len(self.columns['frame'])
+
+    def save(self, path, names):
+        dtypes = {'frame': np.int32, 'timestamp': np.float64, 'face': bool, 'status': np.int8, 'classes': np.uint32}
+        arrays = {k: np.asarray(v, dtype=dtypes.get(k, np.float32)) for k, v in self.columns.items()}
+        np.savez_compressed(path, names=np.asarray(names), **arrays)
+
+
+def replay_source(reader, opt):
+    detector = mydetect.engine.load()
+    face_id = detector.class_id('face')
+    fatigue = FatiguDetector(driver_id=opt.driver, profile_store=DriverProfileStore(opt.profile_path))
+    myfatigue.tracker.reset()
+    myfatigue.tracker.reset_stats()
+    columns = ReplayColumns()
+
+    done = False
+    while not done:
+        # 凑满一批再做一次YOLO前向推理
+        batch = []
+        while len(batch) < opt.batch_size:
+            item = reader.frames.get()
+            if item is None:
+                done = True
+                break
+            batch.append(item)
+        if not batch:
+            break
+
+        dets = detector.predict_batch([img for _, _, img in batch])
+        for (i, ts, img), det in zip(batch, dets):
+            face_rects = [myfatigue.rect_from_xyxy(xyxy) for xyxy in det['xyxy'][det['cls'] == face_id]]
+            _, metrics = myfatigue.analyze_face(img, face_rects)
+            if metrics is not None:
+                status = fatigue.detec_fatigue(round(float(metrics['ear']), 3), round(float(metrics['mar']), 3), ts)
+            else:
+                status = 'normal'
+                fatigue.reset_window()
+            classes = int(np.bitwise_or.reduce(1 << det['cls'].astype(np.uint32))) if len(det) else 0
+            columns.append(i, ts, metrics, status, classes)
+    return columns, detector.names
+
+
+def replay(opt):
+    sources = []
+    for s in opt.source:
+        sources += sorted(glob.glob(s)) if '*' in s else [s]
+    sources = [s for s in sources if os.path.isdir(s) or s.split('.')[-1].lower() in vid_formats]
+    assert sources, f'No videos or image folders found in {opt.source}'
+    os.makedirs(opt.out, exist_ok=True)
+
+    mydetect.engine.backend_name = opt.backend
+    mydetect.load()
+    myfatigue.load()
+    readers = [FrameReader(s, opt.fps) for s in sources]
+    readers[0].start()
+    total_frames, t_total = 0, time.time()
+    for k, reader in enumerate(readers):
+        if k + 1 < len(readers):
+            readers[k + 1].start()  # 处理当前文件时提前解码下一个文件
+        t = time.time()
+        columns, names = replay_source(reader, opt)
+        dt = time.time() - t
+        f = os.path.join(opt.out, Path(reader.source).stem + '.npz')
+        columns.save(f, names)
+        total_frames += len(columns)
+        print(f'{k + 1}/{len(readers)} {reader.source}: {len(columns)} frames, '
+              f'{len(columns) / max(dt, 1e-6):.1f} FPS, saved {f}')
+        print(f'    {myfatigue.tracker.timing_summary()}')
+    dt = time.time() - t_total
+    print(f'Done. {total_frames} frames in {dt:.1f}s ({total_frames / max(dt, 1e-6):.1f} FPS)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', nargs='+', required=True, help='video files, globs or image folders')
+    parser.add_argument('--out', type=str, default='runs/replay', help='output folder for per-source .npz metrics')
+    parser.add_argument('--batch-size', type=int, default=8, help='frames per YOLO forward pass')
+    parser.add_argument('--backend', type=str, default=mydetect.backend, help='pytorch, torchscript or onnx')
+    parser.add_argument('--fps', type=float, default=30.0, help='frame rate for image folders')
+    parser.add_argument('--driver', type=str, default='replay', help='driver id used for calibration')
+    parser.add_argument('--profile-path', type=str, default=None, help='driver profile file (default: in memory)')
+    opt = parser.parse_args()
+    replay(opt)
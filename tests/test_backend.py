@@ -0,0 +1,99 @@
+# mybackend.py 的测试: 随机初始化的小模型, 导出模型的解码、图中的NMS和逐层执行的结果一致
+import json
+from copy import deepcopy
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+pytest.importorskip('yaml')
+
+from models.common import ExportNMS  # noqa: E402
+from models.yolo import Model  # noqa: E402
+from mybackend import GridDecoder, TorchScriptBackend  # noqa: E402
+from utils.general import non_max_suppression  # noqa: E402
+
+CFG = Path(__file__).resolve().parents[1] / 'models' / 'yolov5s.yaml'
+SHAPE = (128, 160)  # 输入尺寸(高, 宽), 两个方向的网格大小不同
+CONF, IOU = 0.005, 0.45  # 随机初始化的模型目标置信度很低(_initialize_biases 的先验), 阈值相应取低
+
+
+@pytest.fixture(scope='module')
+def model():
+    torch.manual_seed(0)
+    return Model(str(CFG), nc=2).eval()
+
+
+def images(n, seed=1):
+    return torch.rand((n, 3) + SHAPE, generator=torch.Generator().manual_seed(seed))
+
+
+def raw_model(model):
+    # 和 models/export.py 一样, Detect() 只输出各层未解码的特征图
+    model = deepcopy(model)
+    model.model[-1].export = True
+    return model
+
+
+def nms_model(model, monkeypatch, conf_thres, iou_thres, max_det):
+    # 和 models/export.py --nms 一样, 解码后接 ExportNMS
+    for k, v in (('conf', conf_thres), ('iou', iou_thres), ('max_det', max_det)):
+        monkeypatch.setattr(ExportNMS, k, v)
+    return deepcopy(model).nms(module=ExportNMS)
+
+
+def meta(model, batch_size, nms=False):
+    m = model.model[-1]
+    return json.dumps({'names': model.names, 'stride': m.stride.tolist(),
+                       'anchor_grid': m.anchor_grid.view(m.nl, -1, 2).tolist(),
+                       'img_size': list(SHAPE), 'batch_size': batch_size, 'nms': nms, 'max_det': 300})
+
+
+def test_grid_decoder_matches_detect(model):
+    img = images(2)
+    m = model.model[-1]
+    with torch.no_grad():
+        pred = model(img)[0]
+        raw = raw_model(model)(img)
+    decode = GridDecoder(m.stride.tolist(), m.anchor_grid.view(m.nl, -1, 2).tolist())
+    torch.testing.assert_close(decode(raw), pred)
+
+
+def test_export_nms_matches_nms(model, monkeypatch):
+    # ExportNMS 每个框只取最高的类别, 和 non_max_suppression 的 multi_label=False 相同, 这里用单类别的模型比较
+    torch.manual_seed(0)
+    model = Model(str(CFG), nc=1).eval()
+    img = images(2)
+    with torch.no_grad():
+        ref = non_max_suppression(model(img)[0], CONF, IOU)
+        out = nms_model(model, monkeypatch, CONF, IOU, 300)(img)
+    assert out.shape == (2, 300, 6)
+    for o, r in zip(out, ref):
+        assert 0 < len(r) < 300
+        torch.testing.assert_close(o[:len(r)], r)
+        assert not o[len(r):].any()  # 补0的行
+
+
+@pytest.mark.parametrize('nms', [False, True])
+def test_torchscript_backend_matches_eager(model, monkeypatch, tmp_path, nms):
+    # 按固定批次 2 导出, 1 张和 3 张时要补齐不足一批的块
+    f = tmp_path / 'model.torchscript.pt'
+    export = nms_model(model, monkeypatch, CONF, IOU, 300) if nms else raw_model(model)
+    ts = torch.jit.trace(export, images(2), strict=False)
+    ts.save(str(f), _extra_files={'config.txt': meta(model, 2, nms)})
+    backend = TorchScriptBackend(str(f), torch.device('cpu')).load()
+    assert (backend.input_shape, backend.batch_size, backend.nms) == (SHAPE, 2, nms)
+
+    for n in (1, 2, 3):
+        img = images(n, seed=n)
+        with torch.no_grad():
+            if nms:  # 图中的NMS和逐层执行的 ExportNMS 比较, ExportNMS 和 non_max_suppression 的一致性见上面的测试
+                ref = [d[d[:, 4] > CONF] for d in export(img)]
+            else:
+                ref = non_max_suppression(model(img)[0], CONF, IOU)
+            out = backend.detect(img, CONF, IOU)
+        assert len(out) == n
+        for o, r in zip(out, ref):
+            assert 0 < len(o) == len(r)
+            torch.testing.assert_close(o, r, atol=1e-3, rtol=1e-4)
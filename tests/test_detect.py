@@ -0,0 +1,75 @@
+# DetectorEngine 的测试: 用假的推理后端替换模型, 不需要权重文件
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+pytest.importorskip('cv2')
+
+import mydetect  # noqa: E402
+
+
+class FakeBackend:
+    # 代替 mybackend.TorchBackend, 记录前向推理的次数, 每张图返回一个固定的检测框
+    name = 'fake'
+    input_shape = None
+    channels_last = False
+    optimize = None
+    half = False
+
+    def __init__(self, box=(10., 20., 110., 220.), conf=0.9, cls=1):
+        self.device = torch.device('cpu')
+        self.model = object()
+        self.names = ['face', 'phone']
+        self.stride = 32
+        self.det = [*box, conf, cls]
+        self.forwards = 0
+        self.inputs = []
+
+    def detect(self, img, conf_thres, iou_thres):
+        self.forwards += 1
+        self.inputs.append(tuple(img.shape))
+        return [torch.tensor([self.det]) for _ in range(len(img))]
+
+
+def fake_engine(**kwargs):
+    backend = FakeBackend(**kwargs)
+    engine = mydetect.DetectorEngine(warmup_shapes=[])
+    engine.backend, engine.device, engine.model = backend, backend.device, backend.model
+    engine.names = backend.names
+    return engine, backend
+
+
+def test_one_forward_per_predict():
+    engine, backend = fake_engine()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    for n in range(1, 6):
+        engine.predict(frame)
+        assert backend.forwards == n
+    assert backend.inputs == [(1, 3, 480, 640)] * 5
+
+
+def test_one_forward_per_batch():
+    engine, backend = fake_engine()
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8)] * 4
+    dets = engine.predict_batch(frames)
+    assert backend.forwards == 1
+    assert backend.inputs == [(4, 3, 480, 640)]
+    assert len(dets) == 4
+
+
+def test_predict_result():
+    engine, backend = fake_engine()
+    det = engine.predict(np.zeros((480, 640, 3), dtype=np.uint8))  # 640x480 不需要缩放和填充
+    assert det.dtype == mydetect.det_dtype
+    assert engine.labels(det) == ['phone']
+    np.testing.assert_allclose(det['xyxy'][0], [10, 20, 110, 220])
+    assert det['conf'][0] == pytest.approx(0.9)
+
+
+def test_det_fields_to_torch():
+    # 对齐的 det_dtype: 字段视图可以直接转成张量, 不需要先复制
+    engine, backend = fake_engine()
+    det = engine.predict_batch([np.zeros((480, 640, 3), dtype=np.uint8)] * 2)[0]
+    assert det.dtype.isalignedstruct
+    torch.testing.assert_close(torch.from_numpy(det['xyxy']), torch.tensor([[10., 20., 110., 220.]]))
+    torch.testing.assert_close(torch.from_numpy(det['conf']), torch.tensor([0.9]))
@@ -0,0 +1,90 @@
+# 显示路径的测试: 帧尺寸不变时, 显示缩放和镜像翻转都复用预分配的缓冲区
+import tracemalloc
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('PyQt5')
+pytest.importorskip('torch')
+pytest.importorskip('cv2')
+pytest.importorskip('dlib')
+pytest.importorskip('playsound')
+
+import main  # noqa: E402
+import mydetect  # noqa: E402
+
+N = 20
+
+
+def frames(n=N, shape=(480, 640, 3)):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(n)]
+
+
+@pytest.mark.parametrize('use_bgr888', [True, False])
+def test_to_qimage_allocations_flat(use_bgr888):
+    display = main.FrameDisplay()
+    display.use_bgr888 = use_bgr888 and hasattr(main.QImage, 'Format_BGR888')
+    counts = []
+    for frame in frames():
+        q_img = display.to_qimage(frame, 320, 240)
+        assert (q_img.width(), q_img.height()) == (320, 240)
+        counts.append(display.allocations)
+    assert counts[0] <= 2  # 缩放缓冲区, 不支持 BGR888 时还有颜色转换缓冲区
+    assert counts == [counts[0]] * N
+
+
+def test_flip_allocations_flat():
+    worker = main.InferenceWorker(grabber=None, fatigue_detector=None)
+    counts, previous = [], None
+    for frame in frames():
+        out = worker._flip(frame)
+        np.testing.assert_array_equal(out, frame[:, ::-1])
+        assert previous is None or not np.shares_memory(out, previous)  # 不覆盖刚送去显示的那一块
+        worker._emitted = worker._writing  # 和 run() 一样, 送去显示
+        previous = out
+        counts.append(worker.allocations)
+    assert counts[:2] == [1, 2]  # 两块缓冲区各分配一次
+    assert counts[2:] == [2] * (N - 2)
+
+
+@pytest.mark.parametrize('box', [(320, 240), (500, 374), (1000, 800)])
+def test_display_path_no_frame_allocations(monkeypatch, box):
+    # tracemalloc 能看到 numpy 的分配(cv2 的输出数组也由 numpy 分配), 这里统计真实的内存而不是计数器:
+    # 前两帧分配两块翻转和显示缓冲区, 之后 _flip -> render -> to_qimage 不应再有帧大小的分配;
+    # 剩下的只有每帧几百字节的小对象(标签、坐标缩放), 远小于一帧
+    monkeypatch.setattr(mydetect.engine, 'names', ['face', 'phone'])
+    worker = main.InferenceWorker(grabber=None, fatigue_detector=None)
+    worker.display_size = box
+    display = main.FrameDisplay()
+    rng = np.random.default_rng(0)
+    action = np.zeros(1, dtype=mydetect.det_dtype)
+    action['cls'], action['conf'], action['xyxy'] = 1, 0.9, [[100, 100, 300, 300]]
+    result = {'shape': rng.integers(100, 400, (68, 2)), 'action': action}
+
+    def show(frame):
+        shown = worker._render(worker._flip(frame), result)
+        worker._emitted = worker._writing  # 和 run() 一样, 送去显示
+        h, w = shown.shape[:2]
+        target_w, target_h = main.fit_size(w, h, *box)
+        q_img = display.to_qimage(shown, target_w, target_h)
+        return shown, q_img
+
+    images = frames()
+    for frame in images[:2]:
+        show(frame)
+    allocations = worker.allocations + display.allocations
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for frame in images[2:]:
+            shown, q_img = show(frame)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak - base < 240 * 320 * 3 // 4, f'{peak - base} bytes allocated per frame'
+    assert worker.allocations + display.allocations == allocations
+    # 推理线程已经按显示尺寸绘制时, UI线程直接显示, 不再缩放
+    if box[0] <= 640:
+        assert (q_img.width(), q_img.height()) == shown.shape[1::-1]
+        assert display.resized is None
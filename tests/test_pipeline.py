@@ -0,0 +1,53 @@
+# mypipeline.py 的测试: 摄像头帧间隔有抖动时, 限速后的采集帧率应接近工作点的 capture_fps
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import mypipeline
+
+CAMERA_FPS = 30.0
+SECONDS = 20.0
+
+
+class FakeCap:
+    # 代替 cv2.VideoCapture: 按带抖动的时间戳产生帧, 用完后停止采集线程
+    def __init__(self, grabber, clock, fps=CAMERA_FPS, jitter=0.005, seconds=SECONDS, seed=0):
+        rng = random.Random(seed)
+        self.stamps = [i / fps + rng.uniform(-jitter, jitter) for i in range(int(fps * seconds))]
+        self.grabber = grabber
+        self.clock = clock
+        self.i = 0
+
+    def grab(self):
+        if self.i >= len(self.stamps):
+            self.grabber._running = False
+            return False
+        self.clock.now = self.stamps[self.i]
+        self.i += 1
+        return True
+
+    def retrieve(self):
+        return True, self.i
+
+
+def captured_fps(monkeypatch, capture_fps):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(mypipeline, 'time', SimpleNamespace(time=lambda: clock.now, sleep=lambda s: None))
+    grabber = mypipeline.LatestFrameGrabber(None)
+    grabber.cap = FakeCap(grabber, clock)
+    grabber.interval = 1.0 / capture_fps
+    grabber._running = True
+    grabber._run()  # 在当前线程中运行到帧用完
+    assert grabber.captured + grabber.skipped == len(grabber.cap.stamps)
+    return grabber.captured / SECONDS
+
+
+@pytest.mark.parametrize('capture_fps', sorted({l['capture_fps'] for l in
+                                                 mypipeline.AdaptiveRateController.default_levels}))
+def test_capture_rate_with_jitter(monkeypatch, capture_fps):
+    assert captured_fps(monkeypatch, capture_fps) == pytest.approx(capture_fps, rel=0.03)
+
+
+def test_unlimited_rate(monkeypatch):
+    assert captured_fps(monkeypatch, float('inf')) == pytest.approx(CAMERA_FPS)
@@ -0,0 +1,32 @@
+# models/quantize.py 的测试: YOLO格式的标签换算成原图的像素坐标
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+pytest.importorskip('cv2')
+
+from models import quantize  # noqa: E402
+
+
+def test_load_labels_pixel_boxes(tmp_path):
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'labels').mkdir()
+    (tmp_path / 'labels' / 'a.txt').write_text('1 0.5 0.5 0.25 0.5\n0 0.1 0.2 0.2 0.4\n')
+    labels = quantize.load_labels([str(tmp_path / 'images' / 'a.jpg')], [(480, 640)])
+    np.testing.assert_allclose(labels[0], [[1, 240, 120, 400, 360], [0, 0, 0, 128, 192]])
+
+
+def test_load_labels_missing(tmp_path):
+    (tmp_path / 'images').mkdir()
+    assert quantize.load_labels([str(tmp_path / 'images' / 'a.jpg')], [(480, 640)]) is None
+
+
+def test_match_det_dtype():
+    import mydetect
+
+    det = np.zeros(2, dtype=mydetect.det_dtype)
+    det['cls'], det['conf'] = [1, 0], [0.9, 0.8]
+    det['xyxy'] = [[240, 120, 400, 360], [0, 0, 128, 192]]
+    labels = np.array([[1, 240, 120, 400, 360], [1, 0, 0, 128, 192]], dtype=np.float32)
+    correct = quantize.match(det, labels, np.array([0.5, 0.95]))
+    np.testing.assert_array_equal(correct, [[True, True], [False, False]])  # 第二个框类别不同
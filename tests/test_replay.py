@@ -0,0 +1,85 @@
+# replay.py 的测试: 用合成的EAR/MAR序列代替YOLO和dlib, 按视频时间戳回放
+import json
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+pytest.importorskip('cv2')
+pytest.importorskip('dlib')
+pytest.importorskip('imutils')
+
+import mydetect  # noqa: E402
+import myfatigue  # noqa: E402
+import replay  # noqa: E402
+
+FPS = 30.0
+
+
+class FakeEngine:
+    # 代替 mydetect.DetectorEngine, 每帧都没有检测框
+    names = ['face', 'phone']
+
+    def load(self):
+        return self
+
+    def class_id(self, name):
+        return self.names.index(name)
+
+    def predict_batch(self, frames):
+        return [np.empty(0, dtype=mydetect.det_dtype) for _ in frames]
+
+
+class FakeReader:
+    # 和 replay.FrameReader 一样的队列: (帧序号, 时间戳(秒), 帧), 结束时为 None; 帧的像素值 1 为睁眼, 0 为闭眼
+    def __init__(self, open_seconds, closed_seconds):
+        self.frames = queue.Queue()
+        n_open, n_closed = int(open_seconds * FPS), int(closed_seconds * FPS)
+        for i in range(n_open + n_closed):
+            self.frames.put((i, i / FPS, np.full((4, 4, 3), int(i < n_open), dtype=np.uint8)))
+        self.frames.put(None)
+
+
+def fake_analyze_face(img, face_rects=None):
+    ear = 0.30 if img[0, 0, 0] else 0.05
+    return None, {'ear': ear, 'mar': 0.30, 'ear_left': ear, 'ear_right': ear, 'roll': 0.0}
+
+
+@pytest.fixture
+def opt(tmp_path, monkeypatch):
+    monkeypatch.setattr(mydetect, 'engine', FakeEngine())
+    monkeypatch.setattr(myfatigue, 'analyze_face', fake_analyze_face)
+    # 已有标定结果, 跳过30秒的标定阶段
+    profile_path = tmp_path / 'profiles.json'
+    profile_path.write_text(json.dumps({'replay': {'eye_thresh': 0.2, 'mar_thresh': 0.65}}))
+    return SimpleNamespace(batch_size=8, driver='replay', profile_path=str(profile_path))
+
+
+def test_replay_eyes_closed(opt):
+    columns, names = replay.replay_source(FakeReader(open_seconds=10, closed_seconds=10), opt)
+    status = np.asarray(columns.columns['status'])
+    n_open = int(10 * FPS)
+    assert len(columns) == 2 * n_open
+    assert names == FakeEngine.names
+    # 视频开头的时间戳从0开始, 睁眼阶段不能被判为疲劳
+    assert (status[:n_open] == replay.status_codes['normal']).all()
+    # 持续闭眼后变为疲劳, 并保持到结束
+    assert status[-1] == replay.status_codes['fatigue']
+    first = np.argmax(status == replay.status_codes['fatigue'])
+    assert n_open < first <= n_open + 3 * FPS
+    assert (status[first:] == replay.status_codes['fatigue']).all()
+
+
+def test_frame_reader_image_folder(tmp_path):
+    import cv2
+
+    for k in (2, 0, 1):
+        cv2.imwrite(str(tmp_path / f'{k}.png'), np.full((8, 8, 3), k, dtype=np.uint8))
+    (tmp_path / 'notes.txt').write_text('not an image')
+    reader = replay.FrameReader(str(tmp_path), fps=10.0)
+    reader.run()
+    items = [reader.frames.get() for _ in range(4)]
+    assert items[-1] is None
+    assert [(i, ts, int(img[0, 0, 0])) for i, ts, img in items[:-1]] == [(0, 0.0, 0), (1, 0.1, 1), (2, 0.2, 2)]
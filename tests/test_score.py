@@ -0,0 +1,36 @@
+# myscore.py 的测试: 按驾驶员加载或重新生成标定结果
+import pytest
+
+pytest.importorskip('numpy')
+
+from config import DriverProfileStore  # noqa: E402
+from myscore import FatiguDetector  # noqa: E402
+
+PROFILE = {'eye_thresh': 0.2, 'mar_thresh': 0.7}
+
+
+def detector():
+    store = DriverProfileStore(None)  # 只保存在内存中
+    store.put('alice', PROFILE)
+    return FatiguDetector(driver_id='alice', profile_store=store)
+
+
+def test_select_driver():
+    fatigue = detector()
+    assert not fatigue.calibrating and fatigue.MAR_THRESH == 0.7
+
+    fatigue.select_driver('bob')  # 没有标定结果, 开始标定
+    assert fatigue.driver_id == 'bob' and fatigue.calibrating
+    for i in range(int(fatigue.CALIBRATION_SECONDS * 10) + 1):
+        fatigue.detec_fatigue(0.3, 0.2, i / 10)
+    assert not fatigue.calibrating
+    assert fatigue.profile_store.get('bob')['mar_thresh'] == pytest.approx(0.2 + fatigue.MAR_MARGIN)
+
+    fatigue.select_driver('alice')
+    assert not fatigue.calibrating and fatigue.MAR_THRESH == 0.7
+
+
+def test_recalibrate():
+    fatigue = detector()
+    fatigue.select_driver('alice', recalibrate=True)
+    assert fatigue.calibrating and fatigue.calibration_ear == []
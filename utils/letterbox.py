@@ -0,0 +1,69 @@
+# Letterbox utils: resize and pad images while meeting stride-multiple constraints
+
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+class LetterboxPlan:
+    # Resize and pad geometry for one input shape, computed once and reused for every frame of that shape
+    def __init__(self, shape, new_shape=(640, 640), auto=True, scaleFill=False, scaleup=True, stride=32):
+        self.shape0 = shape  # original shape [height, width]
+
+        # Scale ratio (new / old)
+        r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+        if not scaleup:  # only scale down, do not scale up (for better test mAP)
+            r = min(r, 1.0)
+
+        # Compute padding
+        ratio = r, r  # width, height ratios
+        new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+        dw, dh = new_shape[1] - new_unpad[0], new_shape[0] - new_unpad[1]  # wh padding
+        if auto:  # minimum rectangle
+            dw, dh = np.mod(dw, stride), np.mod(dh, stride)  # wh padding
+        elif scaleFill:  # stretch
+            dw, dh = 0.0, 0.0
+            new_unpad = (new_shape[1], new_shape[0])
+            ratio = new_shape[1] / shape[1], new_shape[0] / shape[0]  # width, height ratios
+
+        dw /= 2  # divide padding into 2 sides
+        dh /= 2
+
+        self.ratio = ratio
+        self.pad = (dw, dh)
+        self.new_unpad = new_unpad  # resized (width, height) before padding
+        self.resize = tuple(shape[::-1]) != new_unpad
+        self.top, self.bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+        self.left, self.right = int(round(dw - 0.1)), int(round(dw + 0.1))
+        self.shape = (new_unpad[1] + self.top + self.bottom, new_unpad[0] + self.left + self.right)  # output [h, w]
+
+    @property
+    def ratio_pad(self):
+        # Inverse mapping for scale_coords(img1_shape, coords, img0_shape, ratio_pad)
+        return self.ratio, self.pad
+
+    def __call__(self, img, color=(114, 114, 114)):
+        if self.resize:
+            img = cv2.resize(img, self.new_unpad, interpolation=cv2.INTER_LINEAR)
+        return cv2.copyMakeBorder(img, self.top, self.bottom, self.left, self.right, cv2.BORDER_CONSTANT,
+                                  value=color)  # add border
+
+
+@lru_cache(maxsize=256)
+def _cached_plan(shape, new_shape, auto, scaleFill, scaleup, stride):
+    return LetterboxPlan(shape, new_shape, auto, scaleFill, scaleup, stride)
+
+
+def letterbox_plan(shape, new_shape=(640, 640), auto=True, scaleFill=False, scaleup=True, stride=32):
+    # Returns the cached LetterboxPlan for an image shape (h, w[, c])
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    return _cached_plan((int(shape[0]), int(shape[1])), (int(new_shape[0]), int(new_shape[1])), bool(auto),
+                        bool(scaleFill), bool(scaleup), int(stride))
+
+
+def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True, stride=32):
+    # Resize and pad image while meeting stride-multiple constraints
+    plan = letterbox_plan(img.shape, new_shape, auto, scaleFill, scaleup, stride)
+    return plan(img, color), plan.ratio, plan.pad
@@ -1,5 +1,6 @@
 # PyTorch utils
 
+import hashlib
 import logging
 import math
 import os
@@ -192,6 +193,47 @@ def fuse_conv_and_bn(conv, bn):
     return fusedconv
 
 
+def file_hash(path, chunk=1 << 20):
+    # Returns the sha256 hex digest of a file
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(chunk), b''):
+            h.update(b)
+    return h.hexdigest()
+
+
+def optimize_for_inference(model, img, mode='jit', cache_dir=None, key='model'):
+    # Returns an inference-only version of a fused model for inputs shaped like img (channels-last):
+    #   'jit': traced, torch.jit.freeze'd and optimize_for_inference'd, cached as cache_dir/<key>_<shape>.torchscript.pt
+    #   'compile': torch.compile, compiled on first call, with inductor's FX graph cache in cache_dir
+    model = model.to(memory_format=torch.channels_last).eval()
+    img = img.contiguous(memory_format=torch.channels_last)
+    if mode == 'compile':
+        if cache_dir:
+            os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', str(Path(cache_dir) / 'inductor'))
+            import torch._inductor.config
+            torch._inductor.config.fx_graph_cache = True
+        return torch.compile(model)
+    assert mode == 'jit', f'Unknown optimize mode {mode}'
+
+    f = None
+    if cache_dir:
+        shape = 'x'.join(str(x) for x in img.shape)
+        f = Path(cache_dir) / f"{key}_{shape}_{str(img.dtype).split('.')[-1]}_{img.device.type}.torchscript.pt"
+        if f.is_file():
+            logger.info(f'Loading optimized model from {f}')
+            return torch.jit.optimize_for_inference(torch.jit.load(str(f), map_location=img.device))
+
+    t = time.time()
+    with torch.no_grad():
+        ts = torch.jit.freeze(torch.jit.trace(model, img, strict=False).eval())
+    if f is not None:
+        f.parent.mkdir(parents=True, exist_ok=True)
+        ts.save(str(f))
+    logger.info(f'Optimized model for {tuple(img.shape)} in {time.time() - t:.1f}s' + (f', saved to {f}' if f else ''))
+    return torch.jit.optimize_for_inference(ts)
+
+
 def model_info(model, verbose=False, img_size=640):
     # Model information. img_size may be int or list, i.e. img_size=640 or img_size=[640, 320]
     n_p = sum(x.numel() for x in model.parameters())  # number parameters